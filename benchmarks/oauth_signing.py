@@ -0,0 +1,114 @@
+"""
+HMAC-SHA1 request signing in socialauth.lib.oauth2 versus the previous
+implementation, which re-escaped both secrets and re-parsed the URL for every
+signature. The signatures are checked to be identical before timing.
+
+Also compares building and signing a batch of requests one at a time with
+BatchSigner.
+
+Run from the project directory:
+
+    python benchmarks/oauth_signing.py
+"""
+import binascii
+import hmac
+import os
+import random
+import sys
+import timeit
+import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from socialauth.lib import oauth2 as oauth
+from socialauth.lib.oauth2 import escape, _utf8_str
+
+try:
+    import hashlib
+    sha1 = hashlib.sha1
+except ImportError:
+    import sha as sha1
+
+def reference_signature(oauth_request, consumer, token):
+    """The signing code as it was, kept to compare against."""
+    params = dict(oauth_request.parameters)
+    params.pop('oauth_signature', None)
+    key_values = [(escape(_utf8_str(k)), escape(_utf8_str(v)))
+                  for k, v in params.items()]
+    key_values.sort()
+    normalized_params = '&'.join(['%s=%s' % (k, v) for k, v in key_values])
+    scheme, netloc, path = urlparse.urlparse(oauth_request.http_url)[:3]
+    if scheme == 'http' and netloc[-3:] == ':80':
+        netloc = netloc[:-3]
+    elif scheme == 'https' and netloc[-4:] == ':443':
+        netloc = netloc[:-4]
+    sig = (escape(oauth_request.http_method.upper()),
+           escape('%s://%s%s' % (scheme, netloc, path)),
+           escape(normalized_params))
+    key = '%s&' % escape(consumer.secret)
+    if token:
+        key += escape(token.secret)
+    hashed = hmac.new(key, '&'.join(sig), sha1)
+    return binascii.b2a_base64(hashed.digest())[:-1]
+
+consumer = oauth.OAuthConsumer('consumer-key', 'consumer/secret+with=odd&chars')
+token = oauth.OAuthToken('token-key', 'token secret~!*')
+method = oauth.OAuthSignatureMethod_HMAC_SHA1()
+
+def make_request(i=0):
+    params = {'status': u'Hello \u2603 #%d & more' % i, 'count': i, 'since_id': '12345'}
+    return oauth.OAuthRequest.from_consumer_and_token(consumer, token=token,
+        http_method=random.choice(['GET', 'post']),
+        http_url=random.choice(['https://api.twitter.com:443/1/statuses/update.json',
+                                'http://twitter.com/account/verify_credentials.json']),
+        parameters=params)
+
+request = make_request()
+
+def reference():
+    reference_signature(request, consumer, token)
+
+def optimized():
+    method.build_signature(request, consumer, token)
+
+batch = [('https://api.twitter.com/1/statuses/home_timeline.json', 'GET',
+          {'count': 200, 'since_id': i}, oauth.OAuthToken('token-%d' % (i % 50), 'secret-%d' % (i % 50)))
+         for i in range(1000)]
+signer = oauth.BatchSigner(consumer)
+
+def one_at_a_time():
+    for url, http_method, params, t in batch:
+        r = oauth.OAuthRequest.from_consumer_and_token(consumer, token=t,
+            http_method=http_method, http_url=url, parameters=dict(params))
+        r.sign_request(method, consumer, t)
+
+def batch_signer():
+    signer.sign(batch)
+
+def check(count=2000):
+    for i in range(count):
+        r = make_request(i)
+        t = i % 3 and token or None
+        assert method.build_signature(r, consumer, t) == reference_signature(r, consumer, t)
+        r.sign_request(method, consumer, t)
+        expected = reference_signature(r, consumer, t)
+        assert r.get_parameter('oauth_signature') == expected
+        # The signature now present in the parameters must not be signed
+        assert r.build_signature(method, consumer, t) == expected
+    print 'signatures identical for %d requests' % count
+
+if __name__ == '__main__':
+    check()
+    number = 20000
+    for name in ('reference', 'optimized'):
+        seconds = min(timeit.repeat('%s()' % name, 'from __main__ import %s' % name,
+                                    number=number, repeat=3))
+        print '%-14s %8.1f us/signature' % (name, seconds / number * 1e6)
+    for request in signer.sign(batch[:100]):
+        assert request.get_parameter('oauth_signature') == reference_signature(
+            request, consumer, oauth.OAuthToken(request.get_parameter('oauth_token'),
+                                                'secret-' + request.get_parameter('oauth_token')[6:]))
+    for name in ('one_at_a_time', 'batch_signer'):
+        seconds = min(timeit.repeat('%s()' % name, 'from __main__ import %s' % name,
+                                    number=10, repeat=3))
+        print '%-14s %8.1f us/signature' % (name, seconds / 10 / len(batch) * 1e6)
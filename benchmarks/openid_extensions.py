@@ -0,0 +1,50 @@
+"""
+Per-request cost of attaching the SREG/PAPE/AX extension requests in
+openid_consumer.views.begin, rebuilt from settings every time versus the
+precompiled ExtensionTemplates.
+
+Run from the project directory:
+
+    python benchmarks/openid_extensions.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+from django.conf import settings
+
+settings.OPENID_SREG = {"required": "nickname, email",
+                        "optional": "postcode, country",
+                        "policy_url": ""}
+settings.OPENID_PAPE = {"policy_list": "http://schemas.openid.net/pape/policies/2007/06/phishing-resistant",
+                        "max_auth_age": 3600}
+settings.OPENID_AX = [{"type_uri": "http://axschema.org/contact/email",
+                       "count": 1, "required": False, "alias": "email"},
+                      {"type_uri": "http://axschema.org/namePerson",
+                       "count": 1, "required": False, "alias": "fullname"}]
+
+from openid.message import Message, OPENID2_NS
+
+from openid_consumer.views import compile_extension_requests, get_extension_requests
+
+def rebuild():
+    message = Message(OPENID2_NS)
+    for extension in compile_extension_requests(settings.OPENID_SREG,
+                                                settings.OPENID_PAPE,
+                                                settings.OPENID_AX):
+        extension.toMessage(message)
+
+def precompiled():
+    message = Message(OPENID2_NS)
+    for extension in get_extension_requests():
+        extension.toMessage(message)
+
+if __name__ == '__main__':
+    number = 5000
+    for name in ('rebuild', 'precompiled'):
+        seconds = min(timeit.repeat('%s()' % name, 'from __main__ import %s' % name,
+                                    number=number, repeat=3))
+        print '%-12s %8.1f us/request' % (name, seconds / number * 1e6)
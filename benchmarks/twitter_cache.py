@@ -0,0 +1,53 @@
+"""
+Cost of the twitter.Api response cache on the fetch path: a fresh hit as
+Api._GetCached reads it, and a store, for the legacy _FileCache, the
+in-process MemoryCache and the DjangoCache adapter (on Django's configured
+cache, locmem unless CACHE_BACKEND says otherwise).
+
+Run from the project directory, optionally pointing the file cache at the
+directory to measure (e.g. a network mount):
+
+    python benchmarks/twitter_cache.py [directory]
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+from socialauth.lib import twitter
+
+root = len(sys.argv) > 1 and sys.argv[1] or tempfile.mkdtemp()
+caches = {
+    'file': twitter._FileCache(root),
+    'memory': twitter.MemoryCache(),
+    'django': twitter.DjangoCache(),
+}
+keys = ['http://twitter.com/statuses/user_timeline/%d.json' % i for i in range(200)]
+data = '{"text": "%s"}' % ('x' * 2000)
+
+api = twitter.Api()
+api.SetCacheTimeout(60)
+
+def store(name):
+    cache = caches[name]
+    for key in keys:
+        cache.Set(key, data)
+
+def hit(name):
+    api.SetCache(caches[name])
+    for key in keys:
+        assert api._GetCached(key) is not None
+
+if __name__ == '__main__':
+    for name in ('file', 'memory', 'django'):
+        store(name)
+        results = []
+        for func in ('store', 'hit'):
+            seconds = min(timeit.repeat('%s(%r)' % (func, name),
+                                        'from __main__ import %s' % func,
+                                        number=20, repeat=3))
+            results.append(seconds / 20 / len(keys) * 1e6)
+        print '%-8s set %8.1f us   fresh hit %8.1f us' % tuple([name] + results)
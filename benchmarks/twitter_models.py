@@ -0,0 +1,148 @@
+"""
+Hydrating a large timeline into twitter.Status objects (each with its
+twitter.User) with the table-driven Status.NewListFromJsonList, versus the
+previous NewFromJsonDict, which built every object through __init__ and the
+property setters into a per-instance __dict__.
+
+The previous classes are rebuilt here from the current ones minus __slots__,
+so both sides share the same properties. The results are checked to be equal
+before timing. Memory is the size of the model objects themselves (instance
+plus __dict__), not of the strings and numbers they share with the JSON.
+
+Run from the project directory:
+
+    python benchmarks/twitter_models.py [statuses]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+from socialauth.lib import twitter
+from socialauth.lib.twitter import simplejson
+
+def without_slots(model):
+    attrs = dict((name, value) for name, value in model.__dict__.items()
+                 if name != '__slots__' and name not in model.__slots__)
+    return type('Legacy' + model.__name__, (object,), attrs)
+
+LegacyStatus = without_slots(twitter.Status)
+LegacyUser = without_slots(twitter.User)
+
+def legacy_user(data):
+    """User.NewFromJsonDict as it was."""
+    if 'status' in data:
+        status = legacy_status(data['status'])
+    else:
+        status = None
+    return LegacyUser(id=data.get('id', None),
+                      name=data.get('name', None),
+                      screen_name=data.get('screen_name', None),
+                      location=data.get('location', None),
+                      description=data.get('description', None),
+                      statuses_count=data.get('statuses_count', None),
+                      followers_count=data.get('followers_count', None),
+                      favourites_count=data.get('favourites_count', None),
+                      friends_count=data.get('friends_count', None),
+                      profile_image_url=data.get('profile_image_url', None),
+                      profile_background_tile=data.get('profile_background_tile', None),
+                      profile_background_image_url=data.get('profile_background_image_url', None),
+                      profile_sidebar_fill_color=data.get('profile_sidebar_fill_color', None),
+                      profile_background_color=data.get('profile_background_color', None),
+                      profile_link_color=data.get('profile_link_color', None),
+                      profile_text_color=data.get('profile_text_color', None),
+                      protected=data.get('protected', None),
+                      utc_offset=data.get('utc_offset', None),
+                      time_zone=data.get('time_zone', None),
+                      url=data.get('url', None),
+                      status=status)
+
+def legacy_status(data):
+    """Status.NewFromJsonDict as it was."""
+    if 'user' in data:
+        user = legacy_user(data['user'])
+    else:
+        user = None
+    return LegacyStatus(created_at=data.get('created_at', None),
+                        favorited=data.get('favorited', None),
+                        id=data.get('id', None),
+                        text=data.get('text', None),
+                        in_reply_to_screen_name=data.get('in_reply_to_screen_name', None),
+                        in_reply_to_user_id=data.get('in_reply_to_user_id', None),
+                        in_reply_to_status_id=data.get('in_reply_to_status_id', None),
+                        truncated=data.get('truncated', None),
+                        source=data.get('source', None),
+                        user=user)
+
+def fixture_timeline(count):
+    """A timeline as returned by statuses/*_timeline.json, parsed."""
+    statuses = []
+    for i in range(count):
+        user_id = i % 500
+        statuses.append({
+            'id': 1000000 + i,
+            'text': 'Status number %d, with a link http://example.com/%d #tag' % (i, i),
+            'created_at': 'Sat Jan 27 04:17:%02d +0000 2007' % (i % 60),
+            'favorited': False,
+            'truncated': False,
+            'source': '<a href="http://example.com/">client</a>',
+            'in_reply_to_screen_name': i % 3 and 'user%d' % (user_id + 1) or None,
+            'in_reply_to_user_id': i % 3 and user_id + 1 or None,
+            'in_reply_to_status_id': i % 3 and 1000000 + i - 1 or None,
+            'user': {
+                'id': user_id,
+                'name': 'User %d' % user_id,
+                'screen_name': 'user%d' % user_id,
+                'location': 'Somewhere',
+                'description': 'A description of user %d' % user_id,
+                'url': 'http://example.com/user%d' % user_id,
+                'profile_image_url': 'http://example.com/user%d.png' % user_id,
+                'profile_background_tile': False,
+                'profile_background_image_url': 'http://example.com/bg.png',
+                'profile_sidebar_fill_color': 'e0ff92',
+                'profile_background_color': '9ae4e8',
+                'profile_link_color': '0000ff',
+                'profile_text_color': '000000',
+                'protected': False,
+                'utc_offset': -28800,
+                'time_zone': 'Pacific Time (US & Canada)',
+                'followers_count': user_id * 3,
+                'friends_count': user_id * 2,
+                'statuses_count': user_id * 7,
+                'favourites_count': user_id,
+            },
+        })
+    # Round trip, so the dicts are built as the API client builds them
+    return simplejson.loads(simplejson.dumps(statuses))
+
+count = len(sys.argv) > 1 and int(sys.argv[1]) or 20000
+timeline = fixture_timeline(count)
+
+def legacy():
+    return [legacy_status(data) for data in timeline]
+
+def hydrator():
+    return twitter.Status.NewListFromJsonList(timeline)
+
+def object_size(model):
+    size = sys.getsizeof(model)
+    if hasattr(model, '__dict__'):
+        size += sys.getsizeof(model.__dict__)
+    return size
+
+def check():
+    for old, new in zip(legacy(), hydrator()):
+        assert old.AsDict() == new.AsDict()
+    print 'results identical for %d statuses' % count
+
+if __name__ == '__main__':
+    check()
+    for name in ('legacy', 'hydrator'):
+        seconds = min(timeit.repeat('%s()' % name, 'from __main__ import %s' % name,
+                                    number=1, repeat=5))
+        statuses = globals()[name]()
+        size = sum([object_size(s) + object_size(s.user) for s in statuses])
+        print '%-9s %7.1f us/status  %7.0f bytes/status (with its user)' % (
+            name, seconds / count * 1e6, float(size) / count)
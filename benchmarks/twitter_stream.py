@@ -0,0 +1,123 @@
+"""
+Peak memory of turning a large timeline response into twitter.Status objects
+by decoding it incrementally (twitter.Api._FetchList, as the Api's timeline,
+friends, followers and direct message methods now do), versus the previous
+path: read the whole body, simplejson.loads it, then hydrate the list.
+
+The Api runs as configured by default, with the process-wide response cache
+on: a body larger than Api.MAX_CACHED_STREAM is read through without being
+cached. Each path runs in a fresh process and reports how much its peak RSS
+grew; the response is read from a recorded fixture file as if from the
+socket. Both paths are checked to build the same statuses.
+
+Run from the project directory, optionally with a recorded response (a JSON
+list of statuses); otherwise a fixture timeline is written to a temporary
+file:
+
+    python benchmarks/twitter_stream.py [fixture.json]
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+from socialauth.lib import twitter
+from socialauth.lib.twitter import simplejson
+
+class FileUrllib(object):
+    """Stands in for urllib2, serving every request from a file."""
+    def __init__(self, path):
+        self.path = path
+
+    def build_opener(self, *handlers):
+        return self
+
+    def open(self, url, data=None):
+        return open(self.path, 'rb')
+
+    def close(self):
+        pass
+
+def legacy(path):
+    fp = open(path, 'rb')
+    try:
+        json = fp.read()
+    finally:
+        fp.close()
+    data = simplejson.loads(json)
+    return twitter.Status.NewListFromJsonList(data)
+
+def incremental(path):
+    api = twitter.Api()
+    api.SetUrllib(FileUrllib(path))
+    return api.GetUserTimeline('user0')
+
+def write_fixture(count=20000):
+    statuses = []
+    for i in range(count):
+        user_id = i % 500
+        statuses.append({
+            'id': 1000000 + i,
+            'text': 'Status number %d, with a link http://example.com/%d #tag' % (i, i),
+            'created_at': 'Sat Jan 27 04:17:%02d +0000 2007' % (i % 60),
+            'favorited': False,
+            'truncated': False,
+            'source': '<a href="http://example.com/">client</a>',
+            'in_reply_to_screen_name': None,
+            'in_reply_to_user_id': None,
+            'in_reply_to_status_id': None,
+            'user': {
+                'id': user_id,
+                'name': u'User \u2603 %d' % user_id,
+                'screen_name': 'user%d' % user_id,
+                'location': 'Somewhere',
+                'description': 'A description of user %d' % user_id,
+                'url': 'http://example.com/user%d' % user_id,
+                'profile_image_url': 'http://example.com/user%d.png' % user_id,
+                'profile_background_color': '9ae4e8',
+                'protected': False,
+                'utc_offset': -28800,
+                'time_zone': 'Pacific Time (US & Canada)',
+                'followers_count': user_id * 3,
+                'friends_count': user_id * 2,
+                'statuses_count': user_id * 7,
+                'favourites_count': user_id,
+            },
+        })
+    fd, path = tempfile.mkstemp(suffix='.json')
+    os.write(fd, simplejson.dumps(statuses))
+    os.close(fd)
+    return path
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def run(name, path):
+    """Run one path in this process and print its measurements."""
+    before = peak_rss_kb()
+    start = time.time()
+    statuses = globals()[name](path)
+    seconds = time.time() - start
+    checksum = hash(tuple([(s.id, s.text, s.user.screen_name) for s in statuses]))
+    print peak_rss_kb() - before, seconds, len(statuses), checksum
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--run':
+        run(sys.argv[2], sys.argv[3])
+        sys.exit()
+    path = len(sys.argv) > 1 and sys.argv[1] or write_fixture()
+    print 'fixture %s, %.1f MB' % (path, os.path.getsize(path) / 1e6)
+    results = {}
+    for name in ('legacy', 'incremental'):
+        output = subprocess.Popen([sys.executable, __file__, '--run', name, path],
+                                  stdout=subprocess.PIPE).communicate()[0]
+        rss, seconds, count, checksum = output.split()
+        results[name] = (count, checksum)
+        print '%-12s peak RSS +%7.1f MB  %6.2f s  %s statuses' % (
+            name, int(rss) / 1024.0, float(seconds), count)
+    assert results['legacy'] == results['incremental'], 'results differ'
@@ -0,0 +1,205 @@
+"""
+Caching helpers for the OpenID consumer.
+
+Two tiers are used: a small per-process LRU which answers most lookups
+without leaving the interpreter, and a Django cache backend which is shared
+between processes. The backend defaults to Django's configured cache and can
+be overridden with OPENID_CACHE_BACKEND (any URI accepted by get_cache).
+"""
+import threading
+import time
+
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import md5
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    from django.utils.datastructures import SortedDict as OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache as default_cache, get_cache
+
+from openid.consumer.discover import discover
+
+CACHE_PREFIX = 'openid_consumer'
+
+ASSOCIATION_LRU_SIZE = getattr(settings, 'OPENID_ASSOCIATION_LRU_SIZE', 100)
+# Entries in the per-process tier are only trusted for a short while, so a
+# removeAssociation in another process is picked up quickly.
+ASSOCIATION_LOCAL_TIMEOUT = getattr(settings, 'OPENID_ASSOCIATION_LOCAL_TIMEOUT', 60)
+# How long Yadis/XRDS discovery results are reused, in seconds. 0 disables.
+DISCOVERY_CACHE_TIMEOUT = getattr(settings, 'OPENID_DISCOVERY_CACHE_TIMEOUT', 60 * 60)
+
+_backend = None
+
+def get_cache_backend():
+    """Return the Django cache backend shared by the OpenID caches."""
+    global _backend
+    if _backend is None:
+        uri = getattr(settings, 'OPENID_CACHE_BACKEND', None)
+        if uri:
+            _backend = get_cache(uri)
+        else:
+            _backend = default_cache
+    return _backend
+
+def make_key(*parts):
+    """
+    Build a cache key from arbitrary strings. The parts are hashed so that
+    URLs with spaces or more than 250 characters are safe for memcached.
+    """
+    kind, rest = parts[0], parts[1:]
+    encoded = []
+    for part in rest:
+        if isinstance(part, unicode):
+            part = part.encode('utf8')
+        encoded.append(str(part))
+    digest = md5('\0'.join(encoded)).hexdigest()
+    return '%s:%s:%s' % (CACHE_PREFIX, kind, digest)
+
+class LRUCache(object):
+    """
+    A thread-safe, bounded, per-process cache. Every entry carries an absolute
+    expiry time and is dropped when read after that time.
+    """
+    def __init__(self, max_size=100):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        self._lock.acquire()
+        try:
+            try:
+                expires_at, value = self._data.pop(key)
+            except KeyError:
+                return default
+            if expires_at <= time.time():
+                return default
+            # Re-insert to mark the entry as most recently used
+            self._data[key] = (expires_at, value)
+            return value
+        finally:
+            self._lock.release()
+
+    def set(self, key, value, expires_at):
+        if self.max_size <= 0:
+            return
+        self._lock.acquire()
+        try:
+            self._data.pop(key, None)
+            while len(self._data) >= self.max_size:
+                del self._data[iter(self._data).next()]
+            self._data[key] = (expires_at, value)
+        finally:
+            self._lock.release()
+
+    def delete(self, key):
+        self._lock.acquire()
+        try:
+            self._data.pop(key, None)
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._data.clear()
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._data)
+
+class AssociationCache(object):
+    """
+    Read-through cache for OpenID associations. Associations are stored under
+    (server_url, handle) and the newest one for a server additionally under
+    server_url alone, which is what getAssociation asks for on begin().
+    Entries never outlive the association they hold.
+    """
+    def __init__(self, backend=None, local=None):
+        self.backend = backend or get_cache_backend()
+        if local is None:
+            local = LRUCache(ASSOCIATION_LRU_SIZE)
+        self.local = local
+
+    def _key(self, server_url, handle=None):
+        if handle is None:
+            return make_key('assoc', server_url)
+        return make_key('assoc', server_url, handle)
+
+    def get(self, server_url, handle=None):
+        key = self._key(server_url, handle)
+        association = self.local.get(key)
+        if association is None:
+            association = self.backend.get(key)
+            if association is None:
+                return None
+            self._set_local(key, association)
+        if association.getExpiresIn() <= 0:
+            self.local.delete(key)
+            self.backend.delete(key)
+            return None
+        return association
+
+    def set(self, server_url, association, newest=False):
+        """
+        Cache an association. If newest is True the association is also
+        returned for lookups by server_url alone.
+        """
+        expires_in = association.getExpiresIn()
+        if expires_in <= 0:
+            return
+        keys = [self._key(server_url, association.handle)]
+        if newest:
+            keys.append(self._key(server_url))
+        for key in keys:
+            self.backend.set(key, association, expires_in)
+            self._set_local(key, association)
+
+    def invalidate(self, server_url, handle=None):
+        """
+        Forget a single handle, and the newest-association entry for its
+        server, which may be pointing at it.
+        """
+        keys = [self._key(server_url)]
+        if handle is not None:
+            keys.append(self._key(server_url, handle))
+        for key in keys:
+            self.local.delete(key)
+            self.backend.delete(key)
+
+    def _set_local(self, key, association):
+        expires_at = min(association.issued + association.lifetime,
+                         time.time() + ASSOCIATION_LOCAL_TIMEOUT)
+        self.local.set(key, association, expires_at)
+
+_association_cache = None
+
+def get_association_cache():
+    """Return the process-wide AssociationCache."""
+    global _association_cache
+    if _association_cache is None:
+        _association_cache = AssociationCache()
+    return _association_cache
+
+def cached_discover(identifier):
+    """
+    Drop-in replacement for openid.consumer.discover.discover which reuses
+    the (claimed_id, services) result for DISCOVERY_CACHE_TIMEOUT seconds.
+    Failures and empty results are not cached.
+    """
+    if not DISCOVERY_CACHE_TIMEOUT:
+        return discover(identifier)
+    backend = get_cache_backend()
+    key = make_key('discovery', identifier)
+    result = backend.get(key)
+    if result is None:
+        result = discover(identifier)
+        if result[1]:
+            backend.set(key, result, DISCOVERY_CACHE_TIMEOUT)
+    return result
@@ -0,0 +1,23 @@
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from openid_consumer.util import DjangoOpenIDStore, CLEANUP_BATCH_SIZE
+
+class Command(NoArgsCommand):
+    help = "Delete expired OpenID nonces and associations."
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int',
+            default=CLEANUP_BATCH_SIZE,
+            help='Number of rows deleted per statement (default: %d).' % CLEANUP_BATCH_SIZE),
+    )
+
+    def handle_noargs(self, **options):
+        batch_size = options.get('batch_size')
+        verbosity = int(options.get('verbosity', 1))
+        store = DjangoOpenIDStore()
+        nonces = store.cleanupNonces(batch_size)
+        associations = store.cleanupAssociations(batch_size)
+        if verbosity > 0:
+            print "Deleted %d expired nonces and %d expired associations." % (
+                nonces, associations)
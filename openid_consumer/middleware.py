@@ -1,12 +1,35 @@
+from util import OpenID, start_sweeper
+
+class LazyOpenIDs(object):
+    def __get__(self, request, obj_type=None):
+        if not hasattr(request, '_cached_openids'):
+            request._cached_openids = [
+                OpenID.from_session(o) for o in request.session.get('openids', [])
+            ]
+        return request._cached_openids
+
+class LazyOpenID(object):
+    def __get__(self, request, obj_type=None):
+        openids = request.openids
+        if openids:
+            return openids[-1] # Last authenticated OpenID
+        return None
+
 class OpenIDMiddleware(object):
     """
-    Populate request.openid and request.openids with their openid. This comes 
-    either from their cookie or from their session, depending on the presence 
+    Populate request.openid and request.openids with their openid. This comes
+    either from their cookie or from their session, depending on the presence
     of OPENID_USE_SESSIONS.
+
+    Both are read from the session on first access only, so requests that
+    never look at them do not load the session.
     """
+    def __init__(self):
+        start_sweeper()
+
     def process_request(self, request):
-        request.openids = request.session.get('openids', [])
-        if request.openids:
-            request.openid = request.openids[-1] # Last authenticated OpenID
-        else:
-            request.openid = None
+        request.__class__.openids = LazyOpenIDs()
+        request.__class__.openid = LazyOpenID()
+        # Forget values computed before the session changed
+        request.__dict__.pop('_cached_openids', None)
+        return None
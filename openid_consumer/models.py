@@ -1,20 +1,49 @@
+import hashlib
+
 from django.db import models
 
+def _utf8(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+def sha1_hex(value):
+    """Hex sha1 of value, to index strings too long to index directly."""
+    return hashlib.sha1(_utf8(value)).hexdigest()
+
+def association_key(server_url, handle):
+    """The value of Association.key_hash for server_url and handle."""
+    return sha1_hex(_utf8(server_url) + ' ' + _utf8(handle))
+
 class Nonce(models.Model):
     server_url = models.URLField()
-    timestamp  = models.IntegerField()
+    timestamp  = models.IntegerField(db_index=True)
     salt       = models.CharField( max_length=50 )
 
+    class Meta:
+        unique_together = (('server_url', 'timestamp', 'salt'),)
+
     def __unicode__(self):
-        return "Nonce: %s" % self.nonce
+        return "Nonce: %s, %s" % (self.server_url, self.salt)
 
 class Association(models.Model):
     server_url = models.TextField(max_length=2047)
+    server_url_hash = models.CharField(max_length=40, db_index=True)
     handle = models.CharField(max_length=255)
+    # sha1 of server_url and handle; an index on the pair itself would go
+    # over MySQL's key length limit
+    key_hash = models.CharField(max_length=40, unique=True)
     secret = models.TextField(max_length=255) # Stored base64 encoded
     issued = models.IntegerField()
     lifetime = models.IntegerField()
+    expires_at = models.IntegerField(db_index=True) # issued + lifetime
     assoc_type = models.TextField(max_length=64)
 
+    def save(self, *args, **kwargs):
+        self.expires_at = self.issued + self.lifetime
+        self.server_url_hash = sha1_hex(self.server_url)
+        self.key_hash = association_key(self.server_url, self.handle)
+        super(Association, self).save(*args, **kwargs)
+
     def __unicode__(self):
         return "Association: %s, %s" % (self.server_url, self.handle)
@@ -0,0 +1,100 @@
+"""
+Nonce backends used by DjangoOpenIDStore.useNonce for replay detection.
+
+A backend is any class with a use(server_url, timestamp, salt) method that
+returns True the first time a nonce is seen and False on a replay. The
+backend is chosen with OPENID_NONCE_BACKEND:
+
+    'openid_consumer.nonces.DatabaseNonceBackend' (default)
+        One row per nonce in the Nonce table. Shared by every node.
+    'openid_consumer.nonces.CacheNonceBackend'
+        An atomic add() on the OpenID cache backend, with the nonce expiring
+        once its timestamp falls out of the skew window. Shared if the cache
+        is (memcached).
+    'openid_consumer.nonces.MemoryNonceBackend'
+        An in-process, time-bucketed set. Only safe on a single node.
+
+Timestamps outside the allowed skew are rejected by useNonce before the
+backend is consulted, so no backend needs to remember a nonce past its
+timestamp plus oid_nonce.SKEW. A nonce may be dated up to oid_nonce.SKEW
+in the future, so that can be up to twice oid_nonce.SKEW from now.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.utils.importlib import import_module
+
+from openid.store import nonce as oid_nonce
+
+from cache import get_cache_backend, make_key
+from models import Nonce
+
+class DatabaseNonceBackend(object):
+    def use(self, server_url, timestamp, salt):
+        nonce = Nonce( server_url=server_url, timestamp=timestamp, salt=salt)
+        sid = transaction.savepoint()
+        try:
+            nonce.save(force_insert=True)
+        except IntegrityError:
+            # The (server_url, timestamp, salt) triple has been seen: a replay
+            transaction.savepoint_rollback(sid)
+            return False
+        else:
+            transaction.savepoint_commit(sid)
+            return True
+
+class CacheNonceBackend(object):
+    def __init__(self, backend=None, timeout=oid_nonce.SKEW):
+        self.backend = backend or get_cache_backend()
+        self.timeout = timeout
+
+    def use(self, server_url, timestamp, salt):
+        key = make_key('nonce', server_url, timestamp, salt)
+        # Keep the nonce for as long as useNonce would still accept it
+        timeout = max(int(timestamp) + self.timeout - int(time.time()), 1)
+        # add() only succeeds if the key is not already present
+        return bool(self.backend.add(key, 1, timeout))
+
+class MemoryNonceBackend(object):
+    """
+    Keeps nonces in sets bucketed by timestamp, so that whole buckets can be
+    dropped once they fall out of the skew window.
+    """
+    def __init__(self, skew=oid_nonce.SKEW, bucket_size=60):
+        self.skew = skew
+        self.bucket_size = bucket_size
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def use(self, server_url, timestamp, salt):
+        bucket = int(timestamp) // self.bucket_size
+        self._lock.acquire()
+        try:
+            self._expire()
+            seen = self._buckets.setdefault(bucket, set())
+            if (server_url, timestamp, salt) in seen:
+                return False
+            seen.add((server_url, timestamp, salt))
+            return True
+        finally:
+            self._lock.release()
+
+    def _expire(self):
+        oldest = int(time.time() - self.skew) // self.bucket_size
+        for bucket in self._buckets.keys():
+            if bucket < oldest:
+                del self._buckets[bucket]
+
+_nonce_backend = None
+
+def get_nonce_backend():
+    """Return the process-wide nonce backend named by OPENID_NONCE_BACKEND."""
+    global _nonce_backend
+    if _nonce_backend is None:
+        path = getattr(settings, 'OPENID_NONCE_BACKEND',
+                       'openid_consumer.nonces.DatabaseNonceBackend')
+        module, attr = path.rsplit('.', 1)
+        _nonce_backend = getattr(import_module(module), attr)()
+    return _nonce_backend
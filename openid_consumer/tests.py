@@ -0,0 +1,313 @@
+import pickle
+import time
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.http import HttpRequest
+from django.test import TestCase
+
+from openid.association import Association as OIDAssociation
+from openid.extensions.sreg import SRegRequest, SRegResponse
+from openid.message import Message, OPENID2_NS
+from openid.store.nonce import SKEW
+
+from openid_consumer import cache
+from openid_consumer.cache import AssociationCache, LRUCache
+from openid_consumer.middleware import OpenIDMiddleware
+from openid_consumer.models import Association, Nonce, association_key
+from openid_consumer.nonces import CacheNonceBackend, DatabaseNonceBackend, \
+    MemoryNonceBackend
+from openid_consumer.util import DjangoOpenIDStore, CachingConsumer, \
+    CachingGenericConsumer, OpenID, AXAttributes
+from openid_consumer.views import ExtensionTemplate, compile_extension_requests, \
+    get_extension_requests
+
+SERVER_URL = 'https://www.google.com/accounts/o8/ud'
+
+def make_association(handle, issued=None, lifetime=600):
+    if issued is None:
+        issued = int(time.time())
+    return OIDAssociation(handle, 'x' * 20, issued, lifetime, 'HMAC-SHA1')
+
+class LRUCacheTest(TestCase):
+    def test_evicts_least_recently_used(self):
+        lru = LRUCache(max_size=2)
+        expires_at = time.time() + 60
+        lru.set('a', 1, expires_at)
+        lru.set('b', 2, expires_at)
+        lru.get('a')
+        lru.set('c', 3, expires_at)
+        self.assertEqual(lru.get('a'), 1)
+        self.assertEqual(lru.get('b'), None)
+        self.assertEqual(lru.get('c'), 3)
+
+    def test_expired_entries_are_dropped(self):
+        lru = LRUCache()
+        lru.set('a', 1, time.time() - 1)
+        self.assertEqual(lru.get('a'), None)
+        self.assertEqual(len(lru), 0)
+
+class AssociationCacheTest(TestCase):
+    def setUp(self):
+        self.store = DjangoOpenIDStore()
+        self.store.associations = AssociationCache(
+            backend=get_cache('locmem://'), local=LRUCache())
+
+    def test_get_association_is_served_from_cache(self):
+        self.store.storeAssociation(SERVER_URL, make_association('h1'))
+        Association.objects.all().delete()
+        self.assertEqual(self.store.getAssociation(SERVER_URL).handle, 'h1')
+        self.assertEqual(self.store.getAssociation(SERVER_URL, 'h1').handle, 'h1')
+
+    def test_read_through_returns_newest(self):
+        now = int(time.time())
+        self.store.storeAssociation(SERVER_URL, make_association('old', now - 10))
+        self.store.storeAssociation(SERVER_URL, make_association('new', now))
+        self.store.associations.local.clear()
+        self.store.associations.backend.clear()
+        self.assertEqual(self.store.getAssociation(SERVER_URL).handle, 'new')
+
+    def test_remove_association_invalidates(self):
+        self.store.storeAssociation(SERVER_URL, make_association('h1'))
+        self.assertTrue(self.store.removeAssociation(SERVER_URL, 'h1'))
+        self.assertEqual(self.store.getAssociation(SERVER_URL), None)
+        self.assertEqual(self.store.getAssociation(SERVER_URL, 'h1'), None)
+
+    def test_expired_associations_are_not_cached(self):
+        self.store.storeAssociation(SERVER_URL,
+                                    make_association('h1', time.time() - 20, 10))
+        self.assertEqual(self.store.getAssociation(SERVER_URL), None)
+
+class CleanupTest(TestCase):
+    def setUp(self):
+        self.store = DjangoOpenIDStore()
+
+    def test_use_nonce_rejects_replays(self):
+        now = int(time.time())
+        self.assertTrue(self.store.useNonce(SERVER_URL, now, 'salt'))
+        self.assertFalse(self.store.useNonce(SERVER_URL, now, 'salt'))
+        self.assertEqual(Nonce.objects.count(), 1)
+
+    def test_expires_at_is_precomputed(self):
+        self.store.storeAssociation(SERVER_URL, make_association('h1', 1000, 600))
+        self.assertEqual(Association.objects.get(handle='h1').expires_at, 1600)
+
+    def test_long_server_urls(self):
+        url = SERVER_URL + '?' + 'x' * 1000
+        self.store.storeAssociation(url, make_association('h1'))
+        self.store.storeAssociation(SERVER_URL, make_association('h1'))
+        self.store.associations = AssociationCache(
+            backend=get_cache('locmem://'), local=LRUCache())
+        self.assertEqual(self.store.getAssociation(url, 'h1').handle, 'h1')
+        self.assertEqual(Association.objects.get(key_hash=association_key(url, 'h1')).server_url, url)
+        self.assertTrue(self.store.removeAssociation(url, 'h1'))
+        self.assertEqual(self.store.getAssociation(url), None)
+        self.assertNotEqual(self.store.getAssociation(SERVER_URL), None)
+
+    def test_cleanup_deletes_expired_rows_in_batches(self):
+        now = int(time.time())
+        for i in range(5):
+            Nonce(server_url=SERVER_URL, timestamp=now - 2 * SKEW, salt=str(i)).save()
+            Association(server_url=SERVER_URL, handle='old%d' % i, secret='',
+                        issued=now - 1000, lifetime=10, assoc_type='HMAC-SHA1').save()
+        Nonce(server_url=SERVER_URL, timestamp=now, salt='fresh').save()
+        self.store.storeAssociation(SERVER_URL, make_association('fresh'))
+        self.assertEqual(self.store.cleanupNonces(batch_size=2), 5)
+        self.assertEqual(self.store.cleanupAssociations(batch_size=2), 5)
+        self.assertEqual([n.salt for n in Nonce.objects.all()], ['fresh'])
+        self.assertEqual([a.handle for a in Association.objects.all()], ['fresh'])
+
+class NonceBackendTest(TestCase):
+    def check_replay_detection(self, backend):
+        now = int(time.time())
+        self.assertTrue(backend.use(SERVER_URL, now, 'a'))
+        self.assertFalse(backend.use(SERVER_URL, now, 'a'))
+        self.assertTrue(backend.use(SERVER_URL, now, 'b'))
+        self.assertTrue(backend.use('http://yahoo.com/', now, 'a'))
+
+    def test_database_backend(self):
+        self.check_replay_detection(DatabaseNonceBackend())
+
+    def test_cache_backend(self):
+        self.check_replay_detection(CacheNonceBackend(get_cache('locmem://')))
+
+    def test_cache_backend_keeps_future_nonces(self):
+        timeouts = []
+        backend = get_cache('locmem://')
+        add = backend.add
+        def recording_add(key, value, timeout=None):
+            timeouts.append(timeout)
+            return add(key, value, timeout)
+        backend.add = recording_add
+        nonces = CacheNonceBackend(backend)
+        now = int(time.time())
+        self.assertTrue(nonces.use(SERVER_URL, now + SKEW / 2, 'future'))
+        self.assertFalse(nonces.use(SERVER_URL, now + SKEW / 2, 'future'))
+        self.assertTrue(timeouts[0] >= SKEW + SKEW / 2 - 1)
+        nonces.use(SERVER_URL, now - SKEW, 'expiring')
+        self.assertEqual(timeouts[-1], 1)
+
+    def test_memory_backend(self):
+        self.check_replay_detection(MemoryNonceBackend())
+
+    def test_memory_backend_drops_old_buckets(self):
+        backend = MemoryNonceBackend(skew=60, bucket_size=10)
+        backend.use(SERVER_URL, int(time.time()) - 120, 'old')
+        backend.use(SERVER_URL, int(time.time()), 'new')
+        self.assertEqual(len(backend._buckets), 1)
+
+    def test_store_uses_configured_backend(self):
+        store = DjangoOpenIDStore()
+        store.nonces = MemoryNonceBackend()
+        now = int(time.time())
+        self.assertTrue(store.useNonce(SERVER_URL, now, 'salt'))
+        self.assertFalse(store.useNonce(SERVER_URL, now, 'salt'))
+        self.assertFalse(store.useNonce(SERVER_URL, now - 2 * SKEW, 'other'))
+        self.assertEqual(Nonce.objects.count(), 0)
+
+class AssociationLookupTest(TestCase):
+    def setUp(self):
+        self.store = DjangoOpenIDStore()
+        self.store.associations = AssociationCache(
+            backend=get_cache('dummy://'), local=LRUCache(0))
+
+    def test_lookups_skip_expired_rows_without_deleting_them(self):
+        now = int(time.time())
+        for i in range(3):
+            Association(server_url=SERVER_URL, handle='old%d' % i, secret='',
+                        issued=now - 1000, lifetime=10, assoc_type='HMAC-SHA1').save()
+        self.assertEqual(self.store.getAssociation(SERVER_URL), None)
+        self.store.storeAssociation(SERVER_URL, make_association('fresh'))
+        self.assertEqual(self.store.getAssociation(SERVER_URL).handle, 'fresh')
+        self.assertEqual(self.store.getAssociation(SERVER_URL, 'old0'), None)
+        self.assertEqual(Association.objects.count(), 4)
+        self.assertEqual(self.store.cleanupAssociations(), 3)
+        self.assertEqual([a.handle for a in Association.objects.all()], ['fresh'])
+
+    def test_remove_association_reports_existence(self):
+        self.store.storeAssociation(SERVER_URL, make_association('h1'))
+        self.assertTrue(self.store.removeAssociation(SERVER_URL, 'h1'))
+        self.assertFalse(self.store.removeAssociation(SERVER_URL, 'h1'))
+
+class DiscoveryCacheTest(TestCase):
+    def setUp(self):
+        self.calls = []
+        self.discover = cache.discover
+        cache.discover = self.fake_discover
+        cache.get_cache_backend().clear()
+
+    def tearDown(self):
+        cache.discover = self.discover
+
+    def fake_discover(self, identifier):
+        self.calls.append(identifier)
+        if identifier == 'http://example.com/':
+            return identifier, []
+        return identifier, ['endpoint']
+
+    def test_results_are_reused(self):
+        for i in range(3):
+            result = cache.cached_discover('http://yahoo.com/')
+        self.assertEqual(result, ('http://yahoo.com/', ['endpoint']))
+        self.assertEqual(self.calls, ['http://yahoo.com/'])
+
+    def test_empty_results_are_not_cached(self):
+        cache.cached_discover('http://example.com/')
+        cache.cached_discover('http://example.com/')
+        self.assertEqual(len(self.calls), 2)
+
+    def test_consumer_uses_cached_discovery(self):
+        self.assertEqual(CachingConsumer._discover, cache.cached_discover)
+        self.assertEqual(CachingGenericConsumer._discover, cache.cached_discover)
+
+class ExtensionTemplateTest(TestCase):
+    def test_templates_serialize_like_the_extension(self):
+        sreg = SRegRequest(required=['nickname', 'email'], optional=['country'])
+        expected = Message(OPENID2_NS)
+        sreg.toMessage(expected)
+        message = Message(OPENID2_NS)
+        ExtensionTemplate(sreg).toMessage(message)
+        self.assertEqual(message.toPostArgs(), expected.toPostArgs())
+
+    def test_compile_extension_requests(self):
+        sreg, ax = compile_extension_requests(
+            {'required': 'nickname, email', 'optional': 'country'}, False,
+            [{'type_uri': 'http://axschema.org/contact/email', 'count': 1,
+              'required': True, 'alias': 'email'}])
+        self.assertEqual(sreg.getExtensionArgs()['required'], 'nickname,email')
+        self.assertEqual(sreg.getExtensionArgs()['optional'], 'country')
+        self.assertEqual(ax.getExtensionArgs()['type.email'],
+                         'http://axschema.org/contact/email')
+
+    def test_templates_are_reused_until_settings_change(self):
+        self.assertTrue(get_extension_requests() is get_extension_requests())
+        old_sreg = getattr(settings, 'OPENID_SREG', False)
+        settings.OPENID_SREG = {'required': 'email'}
+        try:
+            sreg = get_extension_requests()[0]
+            self.assertEqual(sreg.getExtensionArgs()['required'], 'email')
+        finally:
+            settings.OPENID_SREG = old_sreg
+
+class SessionFormatTest(TestCase):
+    def make_openid(self):
+        openid = OpenID('https://www.google.com/accounts/o8/id?id=abc', 1000,
+                        attrs=['openid.mode', 'openid.identity'])
+        openid.sreg = SRegResponse({'email': 'me@example.com', 'nickname': 'me'})
+        openid.ax = AXAttributes({'http://axschema.org/contact/email': ['me@example.com']})
+        openid.pape = None
+        return openid
+
+    def test_round_trip(self):
+        data = self.make_openid().to_session()
+        self.assertEqual(data[:2], ('https://www.google.com/accounts/o8/id?id=abc', 1000))
+        openid = OpenID.from_session(pickle.loads(pickle.dumps(data)))
+        self.assertEqual(str(openid), 'https://www.google.com/accounts/o8/id?id=abc')
+        self.assertEqual(openid.sreg.get('email'), 'me@example.com')
+        self.assertEqual(openid.ax.getSingle('http://axschema.org/contact/email'),
+                         'me@example.com')
+        self.assertEqual(openid.ax.getSingle('http://axschema.org/namePerson'), None)
+        self.assertEqual(openid.pape, None)
+        self.assertFalse(openid.is_iname)
+
+    def test_session_is_smaller(self):
+        openid = self.make_openid()
+        self.assertTrue(len(pickle.dumps(openid.to_session(), 2)) <
+                        len(pickle.dumps(openid, 2)))
+
+    def test_legacy_session_objects_are_accepted(self):
+        openid = self.make_openid()
+        self.assertTrue(OpenID.from_session(openid) is openid)
+
+class LazyMiddlewareTest(TestCase):
+    class Session(dict):
+        loaded = False
+        def get(self, key, default=None):
+            self.loaded = True
+            return dict.get(self, key, default)
+
+    def make_request(self, openids):
+        request = HttpRequest()
+        request.session = self.Session(openids=openids)
+        OpenIDMiddleware().process_request(request)
+        return request
+
+    def test_session_is_not_loaded_until_accessed(self):
+        request = self.make_request([])
+        self.assertFalse(request.session.loaded)
+        self.assertEqual(request.openid, None)
+        self.assertTrue(request.session.loaded)
+
+    def test_exposes_last_openid(self):
+        request = self.make_request([('http://a.example.com/', 1, None, None, None),
+                                     ('http://b.example.com/', 2, None, None, None)])
+        self.assertEqual([str(o) for o in request.openids],
+                         ['http://a.example.com/', 'http://b.example.com/'])
+        self.assertEqual(str(request.openid), 'http://b.example.com/')
+
+    def test_process_request_refreshes_after_session_change(self):
+        request = self.make_request([])
+        self.assertEqual(request.openid, None)
+        request.session['openids'] = [('http://a.example.com/', 1, None, None, None)]
+        OpenIDMiddleware().process_request(request)
+        self.assertEqual(str(request.openid), 'http://a.example.com/')
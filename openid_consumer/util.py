@@ -10,15 +10,41 @@ else:
         from openid.extensions import pape as openid_pape
         PapeResponse = openid_pape.Response
 
+from openid.consumer.consumer import Consumer, GenericConsumer
 from openid.store import nonce as oid_nonce
 from openid.store.interface import OpenIDStore
 from openid.association import Association as OIDAssociation
 from yadis import xri
 
-import time, base64, md5
+import time, base64, md5, threading, logging
+logger = logging.getLogger('openid_consumer.util')
 
 from django.conf import settings
-from models import Association, Nonce
+from django.db import connection, transaction
+from models import Association, Nonce, association_key, sha1_hex
+from cache import get_association_cache, cached_discover
+from nonces import get_nonce_backend
+
+CLEANUP_BATCH_SIZE = getattr(settings, 'OPENID_CLEANUP_BATCH_SIZE', 1000)
+
+# The parts of a PAPE response kept in the session
+PAPE_ATTRIBUTES = ('auth_policies', 'auth_time', 'nist_auth_level', 'auth_levels')
+
+class AXAttributes(dict):
+    """
+    The values of an AX fetch response, keyed by type URI, with the same
+    getSingle/count helpers as openid.extensions.ax.FetchResponse.
+    """
+    def getSingle(self, type_uri, default=None):
+        values = self.get(type_uri)
+        if not values:
+            return default
+        if len(values) > 1:
+            raise ValueError('More than one value present for %r' % (type_uri,))
+        return values[0]
+
+    def count(self, type_uri):
+        return len(self[type_uri])
 
 class OpenID:
     def __init__(self, openid, issued, attrs=None, sreg=None, pape=None, ax=None):
@@ -28,7 +54,10 @@ class OpenID:
         self.sreg = sreg or {}
         self.pape = pape or {}
         self.ax = ax or {}
-        self.is_iname = (xri.identifierScheme(openid) == 'XRI')
+    
+    @property
+    def is_iname(self):
+        return xri.identifierScheme(self.openid) == 'XRI'
     
     def __repr__(self):
         return '<OpenID: %s>' % self.openid
@@ -36,9 +65,42 @@ class OpenID:
     def __str__(self):
         return self.openid
 
+    def to_session(self):
+        """
+        Return the compact form kept in request.session['openids']: a tuple
+        of the identity URL, the issue time and the extracted sreg, ax and
+        pape attributes as plain dicts (or None).
+        """
+        sreg = ax = pape = None
+        if self.sreg:
+            sreg = dict(self.sreg.items())
+        if self.ax:
+            ax = dict(getattr(self.ax, 'data', self.ax))
+        if self.pape:
+            pape = getattr(self.pape, '__dict__', self.pape)
+            pape = dict([(k, pape.get(k)) for k in PAPE_ATTRIBUTES if k in pape])
+        return (self.openid, self.issued, sreg, ax, pape)
+
+    def from_session(data):
+        """Rebuild an OpenID from the output of to_session."""
+        if isinstance(data, OpenID):
+            # Sessions written before the compact format was introduced
+            return data
+        openid, issued, sreg, ax, pape = data
+        o = OpenID(openid, issued)
+        o.sreg = sreg
+        o.ax = None
+        if ax is not None:
+            o.ax = AXAttributes(ax)
+        o.pape = pape
+        return o
+    from_session = staticmethod(from_session)
+
 class DjangoOpenIDStore(OpenIDStore):
     def __init__(self):
         self.max_nonce_age = 6 * 60 * 60 # Six hours
+        self.associations = get_association_cache()
+        self.nonces = get_nonce_backend()
     
     def storeAssociation(self, server_url, association):
         assoc = Association(
@@ -46,45 +108,41 @@ class DjangoOpenIDStore(OpenIDStore):
             handle = association.handle,
             secret = base64.encodestring(association.secret),
             issued = association.issued,
-            lifetime = association.issued,
+            lifetime = association.lifetime,
             assoc_type = association.assoc_type
         )
         assoc.save()
+        self.associations.invalidate(server_url, association.handle)
+        self.associations.set(server_url, association, newest=True)
     
     def getAssociation(self, server_url, handle=None):
-        assocs = []
+        association = self.associations.get(server_url, handle)
+        if association is not None:
+            return association
+        # Expired rows are skipped here and deleted by cleanupAssociations
+        now = int(time.time())
+        assocs = Association.objects.filter(
+            server_url_hash = sha1_hex(server_url), server_url = server_url,
+            expires_at__gt = now
+        )
         if handle is not None:
-            assocs = Association.objects.filter(
-                server_url = server_url, handle = handle
-            )
-        else:
-            assocs = Association.objects.filter(
-                server_url = server_url
-            )
-        if not assocs:
-            return None
-        associations = []
-        for assoc in assocs:
-            association = OIDAssociation(
-                assoc.handle, base64.decodestring(assoc.secret), assoc.issued,
-                assoc.lifetime, assoc.assoc_type
-            )
-            if association.getExpiresIn() == 0:
-                self.removeAssociation(server_url, assoc.handle)
-            else:
-                associations.append((association.issued, association))
-        if not associations:
+            assocs = assocs.filter(handle = handle)
+        try:
+            assoc = assocs.order_by('-issued')[0]
+        except IndexError:
             return None
-        return associations[-1][1]
+        association = OIDAssociation(
+            assoc.handle, base64.decodestring(assoc.secret), assoc.issued,
+            assoc.lifetime, assoc.assoc_type
+        )
+        self.associations.set(server_url, association, newest=(handle is None))
+        return association
     
     def removeAssociation(self, server_url, handle):
-        assocs = list(Association.objects.filter(
-            server_url = server_url, handle = handle
-        ))
-        assocs_exist = len(assocs) > 0
-        for assoc in assocs:
-            assoc.delete()
-        return assocs_exist
+        self.associations.invalidate(server_url, handle)
+        return _delete_associations(
+            'key_hash = %s', [association_key(server_url, handle)]
+        ) > 0
     
     def storeNonce(self, nonce):
         nonce, created = Nonce.objects.get_or_create(
@@ -95,18 +153,110 @@ class DjangoOpenIDStore(OpenIDStore):
         if abs(timestamp - time.time()) > oid_nonce.SKEW:
             return False
         
-        try:
-            nonce = Nonce( server_url=server_url, timestamp=timestamp, salt=salt)
-            nonce.save()
-        except:
-            raise
-        else:
-            return 1
+        return self.nonces.use(server_url, timestamp, salt)
+    
+    def cleanupNonces(self, batch_size=None):
+        # Nonces outside the allowed skew are rejected by useNonce anyway
+        return _delete_in_batches(
+            Nonce.objects.filter(timestamp__lt=int(time.time()) - oid_nonce.SKEW),
+            batch_size
+        )
+    
+    def cleanupAssociations(self, batch_size=None):
+        return _delete_in_batches(
+            Association.objects.filter(expires_at__lte=int(time.time())),
+            batch_size
+        )
     
     def getAuthKey(self):
         # Use first AUTH_KEY_LEN characters of md5 hash of SECRET_KEY
         return md5.new(settings.SECRET_KEY).hexdigest()[:self.AUTH_KEY_LEN]
 
+class CachingGenericConsumer(GenericConsumer):
+    _discover = staticmethod(cached_discover)
+
+class CachingConsumer(Consumer):
+    """
+    A Consumer whose Yadis/XRDS discovery, both in begin() and when verifying
+    responses in complete(), goes through the shared discovery cache.
+    """
+    _discover = staticmethod(cached_discover)
+
+    def __init__(self, session, store):
+        Consumer.__init__(self, session, store, CachingGenericConsumer)
+
+def _delete_associations(where, params):
+    """
+    Delete Association rows matching a SQL condition in a single statement.
+    QuerySet.delete() would select the rows first and then delete them.
+    """
+    cursor = connection.cursor()
+    cursor.execute('DELETE FROM %s WHERE %s' % (
+        connection.ops.quote_name(Association._meta.db_table), where), params)
+    transaction.commit_unless_managed()
+    return cursor.rowcount
+
+def _delete_in_batches(queryset, batch_size=None):
+    """
+    Delete the rows of queryset, at most batch_size at a time, so that large
+    sweeps never hold long locks. Returns the number of rows deleted.
+    """
+    batch_size = batch_size or CLEANUP_BATCH_SIZE
+    deleted = 0
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        queryset.model.objects.filter(pk__in=pks).delete()
+        transaction.commit_unless_managed()
+        deleted += len(pks)
+
+class Sweeper(threading.Thread):
+    """
+    Background thread that periodically removes expired nonces and
+    associations. Started by OpenIDMiddleware when OPENID_CLEANUP_INTERVAL
+    is set; the cleanup_openid management command does the same job from cron.
+    """
+    def __init__(self, interval):
+        threading.Thread.__init__(self, name='openid-sweeper')
+        self.setDaemon(True)
+        self.interval = interval
+        self.finished = threading.Event()
+
+    def run(self):
+        while not self.finished.isSet():
+            self.finished.wait(self.interval)
+            if self.finished.isSet():
+                break
+            try:
+                nonces, associations = DjangoOpenIDStore().cleanup()
+                logger.info("Swept %d nonces and %d associations",
+                            nonces, associations)
+            except Exception:
+                logger.exception("OpenID cleanup failed")
+            connection.close()
+
+    def cancel(self):
+        self.finished.set()
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+def start_sweeper(interval=None):
+    """Start the process-wide Sweeper, unless one is already running."""
+    global _sweeper
+    interval = interval or getattr(settings, 'OPENID_CLEANUP_INTERVAL', None)
+    if not interval:
+        return None
+    _sweeper_lock.acquire()
+    try:
+        if _sweeper is None or not _sweeper.isAlive():
+            _sweeper = Sweeper(interval)
+            _sweeper.start()
+        return _sweeper
+    finally:
+        _sweeper_lock.release()
+
 def from_openid_response(openid_response):
     issued = int(time.time())
 
@@ -21,12 +21,12 @@ else:
     from openid.extensions.ax import FetchRequest as AXFetchRequest
     from openid.extensions.ax import AttrInfo
 
-from openid.consumer.consumer import Consumer, \
-    SUCCESS, CANCEL, FAILURE, SETUP_NEEDED
+from openid.extension import Extension
+from openid.consumer.consumer import SUCCESS, CANCEL, FAILURE, SETUP_NEEDED
 from openid.consumer.discover import DiscoveryFailure
 from yadis import xri
 
-from util import OpenID, DjangoOpenIDStore, from_openid_response
+from util import OpenID, DjangoOpenIDStore, CachingConsumer, from_openid_response
 from middleware import OpenIDMiddleware
 
 from django.utils.html import escape
@@ -51,6 +51,73 @@ def is_valid_next_url(next):
     # path, not a complete URL.
     return bool(next_url_re.match(next))
 
+class ExtensionTemplate(Extension):
+    """
+    An extension request serialized once and attached to any number of
+    AuthRequests. toMessage only reads from it, so it is never mutated.
+    """
+    def __init__(self, extension):
+        self.ns_uri = extension.ns_uri
+        self.ns_alias = extension.ns_alias
+        self.args = extension.getExtensionArgs()
+
+    def getExtensionArgs(self):
+        return dict(self.args)
+
+def compile_extension_requests(sreg, pape, ax):
+    """
+    Build ExtensionTemplates from the OPENID_SREG, OPENID_PAPE and
+    OPENID_AX settings.
+    """
+    extensions = []
+    if sreg:
+        s = SRegRequest()        
+        for sarg in sreg:
+            if sarg.lower().lstrip() == "policy_url":
+                s.policy_url = sreg[sarg]
+            else:
+                for v in sreg[sarg].split(','):
+                    s.requestField(field_name=v.lower().lstrip(), required=(sarg.lower().lstrip() == "required"))
+        extensions.append(ExtensionTemplate(s))
+
+    if pape:
+        if openid.__version__ <= '2.0.0' and openid.__version__ >= '2.1.0':
+            raise ImportError, 'For pape extension you need python-openid 2.1.0 or newer'
+        p = PapeRequest()
+        for parg in pape:
+            if parg.lower().strip() == 'policy_list':
+                for v in pape[parg].split(','):
+                    p.addPolicyURI(v)
+            elif parg.lower().strip() == 'max_auth_age':
+                p.max_auth_age = pape[parg]
+        extensions.append(ExtensionTemplate(p))
+
+    if ax:
+        axr = AXFetchRequest()
+        for i in ax:
+            axr.add(AttrInfo(i['type_uri'], i['count'], i['required'], i['alias']))
+        extensions.append(ExtensionTemplate(axr))
+
+    return tuple(extensions)
+
+_extension_settings = None
+_extension_requests = ()
+
+def get_extension_requests():
+    """
+    Return the compiled extension requests, recompiling only when one of the
+    extension settings has been replaced.
+    """
+    global _extension_settings, _extension_requests
+    current = (getattr(settings, 'OPENID_SREG', False),
+               getattr(settings, 'OPENID_PAPE', False),
+               getattr(settings, 'OPENID_AX', []))
+    if _extension_settings is None or \
+            [new for new, old in zip(current, _extension_settings) if new is not old]:
+        _extension_requests = compile_extension_requests(*current)
+        _extension_settings = current
+    return _extension_requests
+
 def begin(request, redirect_to=None, on_failure=None, user_url=None, template_name='openid_consumer/signin.html'):
     on_failure = on_failure or default_on_failure
     trust_root = getattr(
@@ -95,46 +162,15 @@ def begin(request, redirect_to=None, on_failure=None, user_url=None, template_na
         ):
         return on_failure(request, _('i-names are not supported'))
     
-    consumer = Consumer(request.session, DjangoOpenIDStore())
+    consumer = CachingConsumer(request.session, DjangoOpenIDStore())
 
     try:
         auth_request = consumer.begin(user_url)
     except DiscoveryFailure:
         return on_failure(request, _('The OpenID was invalid'))
     
-    sreg = getattr(settings, 'OPENID_SREG', False)
-    
-    if sreg:
-        s = SRegRequest()        
-        for sarg in sreg:
-            if sarg.lower().lstrip() == "policy_url":
-                s.policy_url = sreg[sarg]
-            else:
-                for v in sreg[sarg].split(','):
-                    s.requestField(field_name=v.lower().lstrip(), required=(sarg.lower().lstrip() == "required"))
-        auth_request.addExtension(s)  
-    
-    pape = getattr(settings, 'OPENID_PAPE', False)
-
-    if pape:
-        if openid.__version__ <= '2.0.0' and openid.__version__ >= '2.1.0':
-            raise ImportError, 'For pape extension you need python-openid 2.1.0 or newer'
-        p = PapeRequest()
-        for parg in pape:
-            if parg.lower().strip() == 'policy_list':
-                for v in pape[parg].split(','):
-                    p.addPolicyURI(v)
-            elif parg.lower().strip() == 'max_auth_age':
-                p.max_auth_age = pape[parg]
-        auth_request.addExtension(p)
-
-    ax = getattr(settings, 'OPENID_AX', [])
-	
-    if ax:
-        axr = AXFetchRequest()
-        for i in ax:
-            axr.add(AttrInfo(i['type_uri'], i['count'], i['required'], i['alias']))
-        auth_request.addExtension(axr)
+    for extension in get_extension_requests():
+        auth_request.addExtension(extension)
 
     redirect_url = auth_request.redirectURL(trust_root, redirect_to)
     
@@ -145,7 +181,7 @@ def complete(request, on_success=None, on_failure=None, failure_template='openid
     on_success = on_success or default_on_success
     on_failure = on_failure or default_on_failure
     
-    consumer = Consumer(request.session, DjangoOpenIDStore())
+    consumer = CachingConsumer(request.session, DjangoOpenIDStore())
     #dummydebug
     #for r in request.GET.items():
     #    print r
@@ -170,14 +206,13 @@ def complete(request, on_success=None, on_failure=None, failure_template='openid
         assert False, "Bad openid status: %s" % openid_response.status
 
 def default_on_success(request, identity_url, openid_response):
-    if 'openids' not in request.session.keys():
-        request.session['openids'] = []
-    
     # Eliminate any duplicates
-    request.session['openids'] = [
-        o for o in request.session['openids'] if o.openid != identity_url
+    openids = [
+        o for o in request.session.get('openids', [])
+        if OpenID.from_session(o).openid != identity_url
     ]
-    request.session['openids'].append(from_openid_response(openid_response))
+    openids.append(from_openid_response(openid_response).to_session())
+    request.session['openids'] = openids
     
     # Set up request.openids and request.openid, reusing middleware logic
     OpenIDMiddleware().process_request(request)
@@ -1,17 +1,20 @@
 import logging
 logger = logging.getLogger('socialauth.auth_backends')
 
-from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
 from django.core.urlresolvers import reverse
 from django.conf import settings
 # import facebook
 
-from socialauth.lib import oauthtwitter
-from socialauth.models import OpenidProfile, TwitterUserProfile, FacebookUserProfile, LinkedInUserProfile, AuthMeta
+from socialauth.lib import oauthtwitter, resilience, transport
+from socialauth.lib.facebook import get_graph_object
+from socialauth.models import OpenidProfile, TwitterUserProfile, FacebookUserProfile, LinkedInUserProfile, \
+     get_cached_user
 from socialauth.lib.linkedin import *
+from socialauth.signup import create_social_user, get_or_create_social_user
 import urllib
 import random
+import hashlib
 
 
 TWITTER_CONSUMER_KEY = getattr(settings, 'TWITTER_CONSUMER_KEY', '')
@@ -27,29 +30,43 @@ FACEBOOK_URL = getattr(settings, 'FACEBOOK_URL', 'http://api.facebook.com/restse
 LINKEDIN_CONSUMER_KEY = getattr(settings, 'LINKEDIN_CONSUMER_KEY', '')
 LINKEDIN_CONSUMER_SECRET = getattr(settings, 'LINKEDIN_CONSUMER_SECRET', '')
 
-class OpenIdBackend:
+# Fraction of authentications that emit an auth event, and fields to hash in it
+AUTH_LOG_SAMPLE_RATE = getattr(settings, 'SOCIALAUTH_AUTH_LOG_SAMPLE_RATE', 1.0)
+AUTH_LOG_REDACT = getattr(settings, 'SOCIALAUTH_AUTH_LOG_REDACT', ('email',))
+
+def auth_event_enabled():
+    """True if this authentication should emit an auth event."""
+    if not logger.isEnabledFor(logging.INFO):
+        return False
+    return AUTH_LOG_SAMPLE_RATE >= 1 or random.random() < AUTH_LOG_SAMPLE_RATE
+
+def log_auth_event(event):
+    """Log event, a dict, as one structured line with redacted fields hashed."""
+    for key in AUTH_LOG_REDACT:
+        value = event.get(key)
+        if value:
+            if isinstance(value, unicode):
+                value = value.encode('utf8')
+            event[key] = 'sha1:' + hashlib.sha1(value).hexdigest()[:12]
+    logger.info('auth %s', ' '.join(['%s=%r' % item for item in sorted(event.items())]),
+                extra={'auth_event': event})
+
+class SocialAuthBackend:
+    """Base class of the socialauth backends, providing a shared get_user."""
+    def get_user(self, user_id):
+        return get_cached_user(user_id)
+
+class OpenIdBackend(SocialAuthBackend):
     def authenticate(self, openid_key, request, provider, user=None):
-        logger.info("request.GET: %s", request.GET)
-        logger.info("request.POST: %s", request.POST)
-        logger.info('------------------------------------------ Authenticating against OpenID')
-        logger.info("openid_key: %s", openid_key)
-        logger.info("provider: %s", provider)
         try:
-            assoc = OpenidProfile.objects.get(openid_key = openid_key)
-            logger.info('Found a OpenidProfile')
-            logger.info("assoc.openid_key: %s", assoc.openid_key)
-            logger.info("assoc.user.username: %s", assoc.user.username)
-            logger.info("assoc.nickname: %s", assoc.nickname)
-            logger.info("assoc.is_username_valid: %s", assoc.is_username_valid)
-            logger.info("assoc.email: %s", assoc.email)
+            assoc = OpenidProfile.objects.get_for_key(openid_key, request)
+            outcome = 'existing'
             if assoc.email.endswith('@socialauth') and request.openid.ax is not None:
                 assoc.email = request.openid.ax.getSingle('http://axschema.org/contact/email', None)
-                logger.info('Updating existing OpenidProfile with correct openid email')
                 assoc.save()
-            return assoc.user
+                outcome = 'email_updated'
         except OpenidProfile.DoesNotExist:
             #fetch if openid provider provides any simple registration fields
-            logger.info('Creating a OpenidProfile')
             nickname = None
             email = None
             if request.openid and request.openid.sreg:
@@ -61,89 +78,45 @@ class OpenIdBackend:
             if nickname is None :
                 nickname =  ''.join([random.choice('abcdefghijklmnopqrstuvwxyz') for i in xrange(10)])
             
-            name_count = User.objects.filter(username__startswith = nickname).count()
-            if name_count:
-                username = 'OI-{0}{1}'.format(nickname, name_count + 1)
-            else:
-                username = 'OI-{0}'.format(nickname)
-                
-            if email is None :
-                valid_username = False
-                email =  "{0}@socialauth".format(username)
+            profile_fields = {'nickname': nickname,
+                              'is_username_valid': email is not None,
+                              'needs_google_crossdomain_merge': provider == 'Google'}
+            if email is not None:
+                profile_fields['email'] = email
             else:
-                valid_username = True
-            if not user:
-                user = User.objects.create_user(username, email or '')
-                user.set_unusable_password()
-                user.save()
-    
-            #create openid association
-            assoc = OpenidProfile()
-            assoc.openid_key = openid_key
-            assoc.user = user
-            if provider == 'Google':
-                assoc.needs_google_crossdomain_merge = True
-            if email:
-                assoc.email = email
-            if nickname:
-                assoc.nickname = nickname
-            if valid_username:
-                assoc.is_username_valid = True
-            assoc.save()
-
-            logger.info("assoc.openid_key: %s", assoc.openid_key)
-            logger.info("assoc.user.username: %s", assoc.user.username)
-            logger.info("assoc.nickname: %s", assoc.nickname)
-            logger.info("assoc.is_username_valid: %s", assoc.is_username_valid)
-            logger.info("assoc.email: %s", assoc.email)
-
-            #Create AuthMeta
-            auth_meta = AuthMeta(user = user, provider = provider, 
-                provider_model='OpenidProfile', provider_id=assoc.pk)
-            auth_meta.save()
-            return user
-    
-    def get_user(self, user_id):
-        try:
-            user = User.objects.get(pk = user_id)
-            return user
-        except User.DoesNotExist:
-            return None
-
-class LinkedInBackend:
+                # The same placeholder as the User's, after its actual username
+                profile_fields['email'] = lambda user: '%s@socialauth' % user.username
+            assoc, created = create_social_user(OpenidProfile, {'openid_key': openid_key},
+                provider, 'OI', nickname, user=user, email=email,
+                profile_fields=profile_fields)
+            OpenidProfile.objects.remember(request, assoc)
+            outcome = created and 'created' or 'existing'
+
+        if auth_event_enabled():
+            log_auth_event({'backend': 'openid', 'provider': provider,
+                            'outcome': outcome, 'openid_key': openid_key,
+                            'profile_id': assoc.pk, 'user_id': assoc.user_id,
+                            'nickname': assoc.nickname, 'email': assoc.email,
+                            'is_username_valid': assoc.is_username_valid})
+        return assoc.user
+
+class LinkedInBackend(SocialAuthBackend):
     """LinkedInBackend for authentication
     """
     def authenticate(self, linkedin_access_token, user=None):
-        linkedin = LinkedIn(settings.LINKEDIN_CONSUMER_KEY, settings.LINKEDIN_CONSUMER_SECRET)
+        linkedin = get_linkedin(settings.LINKEDIN_CONSUMER_KEY, settings.LINKEDIN_CONSUMER_SECRET)
         # get their profile
         
-        profile = ProfileApi(linkedin).getMyProfile(access_token = linkedin_access_token)
+        profile = resilience.call('linkedin', linkedin.profile_api.getMyProfile,
+                                  access_token = linkedin_access_token, idempotent=True)
 
-        try:
-            user_profile = LinkedInUserProfile.objects.get(linkedin_uid = profile.id)
-            user = user_profile.user
-            return user
-        except LinkedInUserProfile.DoesNotExist:
-            # Create a new user
-            username = 'LI-%s' % profile.id
-            if not user:
-                user = User(username =  username)
-                user.set_unusable_password()
-                user.first_name, user.last_name = profile.firstname, profile.lastname
-                user.email = '{0}@socialauth'.format(username)
-                user.save()
-            userprofile = LinkedInUserProfile(user = user, linkedin_uid = profile.id)
-            userprofile.save()
-            auth_meta = AuthMeta(user=user, provider='LinkedIn').save()
-            return user
+        user_profile, created = get_or_create_social_user(LinkedInUserProfile,
+            {'linkedin_uid': profile.id}, 'LinkedIn', 'LI', profile.id, user=user,
+            user_fields={'first_name': profile.firstname, 'last_name': profile.lastname})
+        return user_profile.user
 
-    def get_user(self, user_id):
-        try:
-            return User.objects.get(pk=user_id)
-        except:
-            return None
 
-class TwitterBackend:
+class TwitterBackend(SocialAuthBackend):
     """TwitterBackend for authentication
     """
     def authenticate(self, twitter_access_token, user=None):
@@ -151,46 +124,27 @@ class TwitterBackend:
         '''
         twitter = oauthtwitter.OAuthApi(TWITTER_CONSUMER_KEY, TWITTER_CONSUMER_SECRET, twitter_access_token)
         try:
-            userinfo = twitter.GetUserInfo()
+            userinfo = resilience.call('twitter', twitter.GetUserInfo, idempotent=True)
         except:
             # If we cannot get the user information, user cannot be authenticated
             raise
 
         screen_name = userinfo.screen_name
         
+        name_data = (userinfo.name or "").split()
         try:
-            user_profile = TwitterUserProfile.objects.get(screen_name = screen_name)
-            user = user_profile.user
-            return user
-        except TwitterUserProfile.DoesNotExist:
-            # Create new user
-            username = "TW-{0}".format(screen_name)
-            if not user:
-                user = User(username =  username)
-                user.set_unusable_password()
-                name_data = userinfo.name.split()
-                try:
-                    first_name, last_name = name_data[0], ' '.join(name_data[1:])
-                except:
-                    first_name, last_name =  screen_name, ''
-                user.first_name, user.last_name = first_name, last_name
-                user.email = screen_name + "@socialauth"
-                #user.email = '%s@example.twitter.com'%(userinfo.screen_name)
-                user.save()
-            userprofile = TwitterUserProfile(user = user, screen_name = screen_name)
-            # userprofile.access_token = access_token.key
-            userprofile.save()
-            auth_meta = AuthMeta(user=user, provider='Twitter', 
-                provider_model='TwitterUserProfile', provider_id=userprofile.pk).save()
-            return user
-
-    def get_user(self, user_id):
-        try:
-            return User.objects.get(pk=user_id)
+            first_name, last_name = name_data[0], ' '.join(name_data[1:])
         except:
-            return None
+            first_name, last_name =  screen_name, ''
+        #user.email = '%s@example.twitter.com'%(userinfo.screen_name)
+        user_profile, created = get_or_create_social_user(TwitterUserProfile,
+            {'screen_name': screen_name}, 'Twitter', 'TW', screen_name, user=user,
+            email=screen_name + "@socialauth",
+            user_fields={'first_name': first_name, 'last_name': last_name})
+        return user_profile.user
 
-class FacebookBackend:
+
+class FacebookBackend(SocialAuthBackend):
     def authenticate(self, request, user=None):
         cookie = facebook.get_user_from_cookie(request.COOKIES,FACEBOOK_APP_ID,FACEBOOK_SECRET_KEY)
 
@@ -213,7 +167,8 @@ class FacebookBackend:
             url = ("https://graph.facebook.com/oauth/access_token?"
                    + urllib.urlencode(params))
             from cgi import parse_qs
-            userdata = urllib.urlopen(url).read()
+            userdata = resilience.call('facebook', lambda: transport.raise_for_server_error(
+                transport.request('GET', url))).read()
             res_parse_qs = parse_qs(userdata)
 
             # Could be a bot query
@@ -222,42 +177,23 @@ class FacebookBackend:
             
             access_token = res_parse_qs['access_token'][-1]
 
-            graph = facebook.GraphAPI(access_token)
-            uid = graph.get_object('me')['id']
+            uid = resilience.call('facebook', get_graph_object, access_token, idempotent=True)['id']
 
         try:
-            fb_user = FacebookUserProfile.objects.get(facebook_uid=uid)
+            fb_user = FacebookUserProfile.objects.select_related('user').get(facebook_uid=uid)
             return fb_user.user
 
         except FacebookUserProfile.DoesNotExist:
 
             # create new FacebookUserProfile
-            graph = facebook.GraphAPI(access_token)
-            fb_data = graph.get_object("me")
+            fb_data = resilience.call('facebook', get_graph_object, access_token, idempotent=True)
 
             if not fb_data:
                 return None
 
-            if not user:
-                username = 'FB-%s' % fb_data['id']
-                user = User.objects.create(username=username)
-                user.first_name = fb_data['first_name']
-                user.last_name = fb_data['last_name']
-                user.email = username + "@socialauth"
-                user.set_unusable_password()
-                user.save()
-
-            fb_profile = FacebookUserProfile(facebook_uid=uid, user=user)
-            fb_profile.save()
-
-            auth_meta = AuthMeta(user=user, provider='Facebook',
-                provider_model='FacebookUserProfile', provider_id=fb_profile.pk).save()
+            fb_profile, created = create_social_user(FacebookUserProfile,
+                {'facebook_uid': uid}, 'Facebook', 'FB', fb_data['id'], user=user,
+                user_fields={'first_name': fb_data['first_name'],
+                             'last_name': fb_data['last_name']})
 
-            return user
-
-
-    def get_user(self, user_id):
-        try:
-            return User.objects.get(pk=user_id)
-        except:
-            return None
+            return fb_profile.user
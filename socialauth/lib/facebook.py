@@ -1,13 +1,32 @@
 import md5
 import urllib
 import time
+
+import transport
 try:
     import json as simplejson
 except:
     from django.utils import simplejson
 
 REST_SERVER = 'http://api.facebook.com/restserver.php'
+GRAPH_URL = 'https://graph.facebook.com'
+FORM_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded'}
+
 
+class GraphAPIError(Exception):
+    pass
+
+def get_graph_object(access_token, id='me'):
+    # GraphAPI.get_object, but through the provider transport so that the
+    # deadline and 5xx accounting of resilience.call apply
+    url = '%s/%s?%s' % (GRAPH_URL, urllib.quote(id),
+                        urllib.urlencode({'access_token': access_token}))
+    response = simplejson.load(transport.raise_for_server_error(
+        transport.request('GET', url)))
+    if isinstance(response, dict) and response.get('error'):
+        error = response['error']
+        raise GraphAPIError(error.get('type'), error.get('message'))
+    return response
 
 def get_user_info(api_key, api_secret, cookies):
     user_info_params = {
@@ -23,7 +42,8 @@ def get_user_info(api_key, api_secret, cookies):
     user_info_hash = get_facebook_signature(api_key, api_secret, user_info_params)
     user_info_params['sig'] = user_info_hash            
     user_info_params = urllib.urlencode(user_info_params)
-    user_info_response  = simplejson.load(urllib.urlopen(REST_SERVER, user_info_params))
+    user_info_response  = simplejson.load(transport.raise_for_server_error(
+        transport.request('POST', REST_SERVER, user_info_params, FORM_HEADERS)))
     return user_info_response
 
 def get_friends(api_key, api_secret, cookies):
@@ -55,7 +75,8 @@ def talk_to_fb(api_key, api_secret, params):
     sig = get_facebook_signature(api_key, api_secret, params)
     params['sig'] = sig
     data = urllib.urlencode(params)
-    response = simplejson.load(urllib.urlopen(REST_SERVER, data))
+    response = simplejson.load(transport.raise_for_server_error(
+        transport.request('POST', REST_SERVER, data, FORM_HEADERS)))
     return response
 
     
@@ -0,0 +1,149 @@
+"""
+A shared pool of worker threads for provider calls made in the background.
+
+submit() runs a blocking call on the pool and returns a Future at once:
+
+    future = futures.submit(fetch, page + 1)
+    ...                     # consume the current page
+    items = future.result(timeout=10)
+
+twitter.Api.IterPages uses it to prefetch the next page. The number of
+worker threads is set by SOCIALAUTH_PROVIDER_WORKERS (8).
+"""
+import logging
+import sys
+import threading
+import Queue
+
+from django.conf import settings
+
+logger = logging.getLogger('socialauth.lib.futures')
+
+WORKERS = getattr(settings, 'SOCIALAUTH_PROVIDER_WORKERS', 8)
+
+class TimeoutError(Exception):
+    pass
+
+class Future(object):
+    """The result of a call running on the executor."""
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def done(self):
+        return self._done.isSet()
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exc_info):
+        self._exc_info = exc_info
+        self._finish()
+
+    def _finish(self):
+        self._lock.acquire()
+        try:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        finally:
+            self._lock.release()
+        for callback in callbacks:
+            self._run_callback(callback)
+
+    def _run_callback(self, callback):
+        # A failing callback must not affect the caller, which may be a worker
+        try:
+            callback(self)
+        except Exception:
+            logger.exception('Future callback %r raised', callback)
+
+    def add_done_callback(self, callback):
+        """Call callback(future) once the call finishes."""
+        self._lock.acquire()
+        try:
+            if not self._done.isSet():
+                self._callbacks.append(callback)
+                return
+        finally:
+            self._lock.release()
+        self._run_callback(callback)
+
+    def exception(self, timeout=None):
+        self._wait(timeout)
+        return self._exc_info and self._exc_info[1]
+
+    def result(self, timeout=None):
+        """Return the call's result, re-raising its exception if it failed."""
+        self._wait(timeout)
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def _wait(self, timeout):
+        self._done.wait(timeout)
+        if not self._done.isSet():
+            raise TimeoutError('Provider call did not finish in %s seconds' % timeout)
+
+class Executor(object):
+    """A fixed pool of daemon threads running submitted calls."""
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+        self._queue = Queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        self._start()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def _start(self):
+        if len(self._threads) >= self.workers:
+            return
+        self._lock.acquire()
+        try:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work,
+                                          name='socialauth-provider-%d' % len(self._threads))
+                thread.setDaemon(True)
+                thread.start()
+                self._threads.append(thread)
+        finally:
+            self._lock.release()
+
+    def _work(self):
+        while True:
+            future, func, args, kwargs = self._queue.get()
+            try:
+                try:
+                    result = func(*args, **kwargs)
+                except:
+                    future.set_exception(sys.exc_info())
+                else:
+                    future.set_result(result)
+            except:
+                # Nothing may end the loop: _start() never replaces a worker
+                logger.exception('Provider executor worker error')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """Return the process-wide Executor."""
+    global _executor
+    if _executor is None:
+        _executor_lock.acquire()
+        try:
+            if _executor is None:
+                _executor = Executor()
+        finally:
+            _executor_lock.release()
+    return _executor
+
+def submit(func, *args, **kwargs):
+    return get_executor().submit(func, *args, **kwargs)
@@ -0,0 +1,103 @@
+"""
+Incremental decoding of JSON arrays.
+
+iter_array() reads a JSON array from a file-like object a chunk at a time
+and yields each item as soon as it has been read in full, so neither the
+whole body nor the whole decoded list needs to be in memory at once:
+
+    for item in jsonstream.iter_array(response):
+        ...
+"""
+import re
+
+try:
+    import json as simplejson
+except ImportError:
+    from django.utils import simplejson
+
+CHUNK_SIZE = 16 * 1024
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+_numbers = (int, long, float)
+_number_chars = '0123456789.eE+-'
+
+class NotAnArray(ValueError):
+    """The document is valid JSON but not an array; value is its decoding."""
+    def __init__(self, value):
+        ValueError.__init__(self, 'Expected a JSON array')
+        self.value = value
+
+class _Reader(object):
+    """A buffer over fp, holding the unread part of the document."""
+    def __init__(self, fp, chunk_size):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size):
+        """Read up to size more bytes. Returns False at the end of fp."""
+        if self.eof:
+            return False
+        data = self.fp.read(size)
+        if not data:
+            self.eof = True
+            return False
+        # Drop what has been decoded already
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next character, or '' at the end."""
+        while True:
+            self.pos = _whitespace.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill(self.chunk_size):
+                return ''
+
+    def decode(self, decoder):
+        """Decode the JSON value starting at the current position."""
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                # Incomplete, unless there is nothing more to read
+                if not self.fill(size):
+                    raise
+                size *= 2
+                continue
+            if (isinstance(value, _numbers) and not isinstance(value, bool)
+                and self.buffer[end:end + 1] in _number_chars and self.fill(size)):
+                # The number may go on in the next chunk
+                continue
+            self.pos = end
+            return value
+
+def iter_array(fp, chunk_size=CHUNK_SIZE, decoder=None):
+    """
+    Yield the items of the JSON array read from fp. Raises NotAnArray if the
+    document is some other JSON value, and ValueError if it is not valid JSON.
+    """
+    decoder = decoder or simplejson.JSONDecoder()
+    reader = _Reader(fp, chunk_size)
+    first = reader.peek()
+    if first != '[':
+        if not first:
+            raise ValueError('No JSON object could be decoded')
+        raise NotAnArray(reader.decode(decoder))
+    reader.pos += 1
+    if reader.peek() == ']':
+        return
+    while True:
+        reader.peek()
+        yield reader.decode(decoder)
+        char = reader.peek()
+        if char == ']':
+            return
+        if char != ',':
+            raise ValueError('Expected "," or "]" in JSON array, got %r' % char)
+        reader.pos += 1
@@ -10,14 +10,14 @@ Enjoy!
 """
 
 import hashlib
-import urllib2
-import httplib
+import threading
 
 import time
 
 from xml.dom.minidom import parseString
 
 import oauth.oauth as oauth
+from transport import get_transport, raise_for_server_error
 
 class LinkedIn():
         LI_SERVER = "api.linkedin.com"
@@ -29,16 +29,22 @@ class LinkedIn():
 
 
 
-        def __init__(self, api_key, secret_key):
+        def __init__(self, api_key, secret_key, transport=None):
+                """
+                The client keeps no per-request state; requests go through
+                the shared connection pool, so one instance can be used by
+                all threads (see get_linkedin).
+                """
                 self.api_key = api_key
                 self.secret_key = secret_key
 
-                self.connection = httplib.HTTPSConnection(self.LI_SERVER)
+                self.transport = transport or get_transport()
                 self.consumer = oauth.OAuthConsumer(api_key, secret_key)
                 self.sig_method = oauth.OAuthSignatureMethod_HMAC_SHA1()
         
                 self.status_api = StatusApi(self)
                 self.connections_api = ConnectionsApi(self)
+                self.profile_api = ProfileApi(self)
 
         def getRequestToken(self, callback):
                 """
@@ -52,9 +58,8 @@ class LinkedIn():
                 oauth_request.sign_request(self.sig_method, self.consumer, None)
 
 
-                self.connection.request(oauth_request.http_method,
-                                self.REQUEST_TOKEN_URL, headers = oauth_request.to_header())
-                response = self.connection.getresponse().read()
+                response = raise_for_server_error(self.transport.request(oauth_request.http_method,
+                                self.REQUEST_TOKEN_URL, headers = oauth_request.to_header())).read()
                 
                 token = oauth.OAuthToken.from_string(response)
                 return token
@@ -81,14 +86,33 @@ class LinkedIn():
                 oauth_request = oauth.OAuthRequest.from_consumer_and_token(self.consumer, token=token, verifier=verifier, http_url=self.ACCESS_TOKEN_URL)
                 oauth_request.sign_request(self.sig_method, self.consumer, token)
 
-                self.connection.request(oauth_request.http_method, self.ACCESS_TOKEN_URL, headers=oauth_request.to_header()) 
-                response = self.connection.getresponse()
+                response = raise_for_server_error(self.transport.request(oauth_request.http_method,
+                                self.ACCESS_TOKEN_URL, headers=oauth_request.to_header()))
                 return oauth.OAuthToken.from_string(response.read())
 
         """
         More functionality coming soon...
         """
 
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_linkedin(api_key, secret_key):
+        """
+        Return the process-wide LinkedIn client for api_key and secret_key.
+        """
+        key = (api_key, secret_key)
+        client = _clients.get(key)
+        if client is None:
+                _clients_lock.acquire()
+                try:
+                        client = _clients.get(key)
+                        if client is None:
+                                client = _clients[key] = LinkedIn(api_key, secret_key)
+                finally:
+                        _clients_lock.release()
+        return client
+
 class LinkedInApi():
         def __init__(self, linkedin):
                 self.linkedin = linkedin
@@ -96,9 +120,8 @@ class LinkedInApi():
                 oauth_request = oauth.OAuthRequest.from_consumer_and_token(self.linkedin.consumer, token=access_token, http_url=url)
                 oauth_request.sign_request(self.linkedin.sig_method, self.linkedin.consumer, access_token)
 
-                self.linkedin.connection.request(oauth_request.http_method, url,
-                                headers=oauth_request.to_header())
-                return self.linkedin.connection.getresponse().read()
+                return raise_for_server_error(self.linkedin.transport.request(oauth_request.http_method,
+                                url, headers=oauth_request.to_header())).read()
 
 
 class StatusApi(LinkedInApi):
@@ -22,14 +22,22 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
+import base64
 import cgi
+import os
+import threading
 import urllib
 import time
-import random
 import urlparse
 import hmac
 import binascii
 
+try:
+    import hashlib # 2.5
+    sha1 = hashlib.sha1
+except ImportError:
+    import sha as sha1 # Deprecated
+
 
 VERSION = '1.0' # Hi Blaine!
 HTTP_METHOD = 'GET'
@@ -56,13 +64,91 @@ def _utf8_str(s):
     else:
         return str(s)
 
+# Escaped parameter names; the same few names are signed over and over
+_escaped_keys = {}
+
+def _escape_key(k):
+    try:
+        return _escaped_keys[k]
+    except KeyError:
+        if len(_escaped_keys) > 1000:
+            _escaped_keys.clear()
+        escaped = _escaped_keys[k] = escape(_utf8_str(k))
+        return escaped
+
+def escaped_secret(credentials):
+    """The escaped secret of a consumer or token, cached on the object."""
+    cached = getattr(credentials, '_escaped_secret', None)
+    if cached is None or cached[0] is not credentials.secret:
+        cached = (credentials.secret, escape(credentials.secret))
+        try:
+            credentials._escaped_secret = cached
+        except AttributeError:
+            pass
+    return cached[1]
+
+def signing_key(consumer, token):
+    """The HMAC-SHA1 and PLAINTEXT key for consumer and token."""
+    if token:
+        return '%s&%s' % (escaped_secret(consumer), escaped_secret(token))
+    return '%s&' % escaped_secret(consumer)
+
+# Normalized forms of the URLs requests are signed for, by http_url
+_normalized_urls = {}
+
+def normalize_http_url(http_url):
+    """Return http_url as scheme://host/path, without a default port."""
+    try:
+        return _normalized_urls[http_url]
+    except KeyError:
+        pass
+    parts = urlparse.urlparse(http_url)
+    scheme, netloc, path = parts[:3]
+    # Exclude default port numbers.
+    if scheme == 'http' and netloc[-3:] == ':80':
+        netloc = netloc[:-3]
+    elif scheme == 'https' and netloc[-4:] == ':443':
+        netloc = netloc[:-4]
+    if len(_normalized_urls) > 1000:
+        _normalized_urls.clear()
+    normalized = _normalized_urls[http_url] = '%s://%s%s' % (scheme, netloc, path)
+    return normalized
+
 def generate_timestamp():
     """Get seconds since epoch (UTC)."""
     return int(time.time())
 
-def generate_nonce(length=8):
-    """Generate pseudorandom number."""
-    return ''.join([str(random.randint(0, 9)) for i in range(length)])
+class _EntropyPool(object):
+    """Bytes from os.urandom, read size bytes at a time."""
+    def __init__(self, size=4096):
+        self.size = size
+        self._bytes = ''
+        self._offset = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def read(self, n):
+        self._lock.acquire()
+        try:
+            # A forked child must not hand out the bytes its parent will use
+            if self._offset + n > len(self._bytes) or self._pid != os.getpid():
+                self._bytes = os.urandom(max(self.size, n))
+                self._offset = 0
+                self._pid = os.getpid()
+            start = self._offset
+            self._offset += n
+            return self._bytes[start:self._offset]
+        finally:
+            self._lock.release()
+
+_entropy = _EntropyPool()
+
+# 22 URL-safe base64 characters carry 132 bits
+NONCE_LENGTH = 22
+
+def generate_nonce(length=NONCE_LENGTH):
+    """Generate a random URL-safe nonce of length characters."""
+    return base64.urlsafe_b64encode(_entropy.read((length * 3 + 3) // 4))[:length]
 
 
 class OAuthConsumer(object):
@@ -179,15 +265,9 @@ class OAuthRequest(object):
 
     def get_normalized_parameters(self):
         """Return a string that contains the parameters that must be signed."""
-        params = self.parameters
-        try:
-            # Exclude the signature if it exists.
-            del params['oauth_signature']
-        except:
-            pass
-        # Escape key values before sorting.
-        key_values = [(escape(_utf8_str(k)), escape(_utf8_str(v))) \
-            for k,v in params.items()]
+        # Escape key values before sorting, excluding the signature.
+        key_values = [(_escape_key(k), escape(_utf8_str(v)))
+            for k, v in self.parameters.iteritems() if k != 'oauth_signature']
         # Sort lexicographically, first after key, then after value.
         key_values.sort()
         # Combine key value pairs into a string.
@@ -199,14 +279,7 @@ class OAuthRequest(object):
 
     def get_normalized_http_url(self):
         """Parses the URL and rebuilds it to be scheme://host/path."""
-        parts = urlparse.urlparse(self.http_url)
-        scheme, netloc, path = parts[:3]
-        # Exclude default port numbers.
-        if scheme == 'http' and netloc[-3:] == ':80':
-            netloc = netloc[:-3]
-        elif scheme == 'https' and netloc[-4:] == ':443':
-            netloc = netloc[:-4]
-        return '%s://%s%s' % (scheme, netloc, path)
+        return normalize_http_url(self.http_url)
 
     def sign_request(self, signature_method, consumer, token):
         """Set the signature parameter to the result of build_signature."""
@@ -553,11 +626,8 @@ class OAuthSignatureMethod_HMAC_SHA1(OAuthSignatureMethod):
             escape(oauth_request.get_normalized_parameters()),
         )
 
-        key = '%s&' % escape(consumer.secret)
-        if token:
-            key += escape(token.secret)
         raw = '&'.join(sig)
-        return key, raw
+        return signing_key(consumer, token), raw
 
     def build_signature(self, oauth_request, consumer, token):
         """Builds the base signature string."""
@@ -565,17 +635,85 @@ class OAuthSignatureMethod_HMAC_SHA1(OAuthSignatureMethod):
             token)
 
         # HMAC object.
-        try:
-            import hashlib # 2.5
-            hashed = hmac.new(key, raw, hashlib.sha1)
-        except:
-            import sha # Deprecated
-            hashed = hmac.new(key, raw, sha)
+        hashed = hmac.new(key, raw, sha1)
 
         # Calculate the digest base 64.
         return binascii.b2a_base64(hashed.digest())[:-1]
 
 
+class BatchSigner(object):
+    """Signs many requests for one consumer with HMAC-SHA1.
+
+    The consumer's escaped parameters and the HMAC key schedule for each
+    token are computed once and shared by every request in the batch:
+
+        signer = BatchSigner(consumer)
+        requests = signer.sign([(url, 'GET', {'count': 200}, token), ...])
+        headers = signer.sign_headers([(url, 'GET', None, token), ...])
+    """
+    # Prepared HMACs kept per token secret
+    max_tokens = 10000
+
+    def __init__(self, consumer):
+        self.consumer = consumer
+        self.signature_method = OAuthSignatureMethod_HMAC_SHA1()
+        self.defaults = {
+            'oauth_consumer_key': consumer.key,
+            'oauth_signature_method': self.signature_method.get_name(),
+            'oauth_version': OAuthRequest.version,
+        }
+        self._escaped_defaults = dict([(k, (_escape_key(k), escape(_utf8_str(v))))
+            for k, v in self.defaults.iteritems()])
+        self._hmacs = {}
+
+    def _hmac(self, token):
+        secret = token and token.secret
+        prepared = self._hmacs.get(secret)
+        if prepared is None:
+            if len(self._hmacs) >= self.max_tokens:
+                self._hmacs.clear()
+            prepared = self._hmacs[secret] = hmac.new(
+                signing_key(self.consumer, token), None, sha1)
+        return prepared.copy()
+
+    def sign_request(self, http_url, http_method=HTTP_METHOD, parameters=None,
+            token=None):
+        """Return a signed OAuthRequest, as from_consumer_and_token and
+        sign_request would."""
+        request_params = {
+            'oauth_timestamp': generate_timestamp(),
+            'oauth_nonce': generate_nonce(),
+        }
+        if parameters:
+            request_params.update(parameters)
+        if token:
+            request_params['oauth_token'] = token.key
+        request_params.pop('oauth_signature', None)
+        key_values = [pair for k, pair in self._escaped_defaults.iteritems()
+            if k not in request_params]
+        key_values.extend([(_escape_key(k), escape(_utf8_str(v)))
+            for k, v in request_params.iteritems()])
+        key_values.sort()
+        raw = '&'.join((escape(http_method.upper()),
+                        escape(normalize_http_url(http_url)),
+                        escape('&'.join(['%s=%s' % kv for kv in key_values]))))
+        hashed = self._hmac(token)
+        hashed.update(raw)
+        signed = dict(self.defaults)
+        signed.update(request_params)
+        signed['oauth_signature'] = binascii.b2a_base64(hashed.digest())[:-1]
+        return OAuthRequest(http_method, http_url, signed)
+
+    def sign(self, requests):
+        """Sign (http_url, http_method, parameters, token) tuples."""
+        sign_request = self.sign_request
+        return [sign_request(*request) for request in requests]
+
+    def sign_headers(self, requests, realm=''):
+        """Like sign, but return the Authorization headers."""
+        return [request.to_header(realm) for request in self.sign(requests)]
+
+
 class OAuthSignatureMethod_PLAINTEXT(OAuthSignatureMethod):
 
     def get_name(self):
@@ -583,9 +721,7 @@ class OAuthSignatureMethod_PLAINTEXT(OAuthSignatureMethod):
 
     def build_signature_base_string(self, oauth_request, consumer, token):
         """Concatenates the consumer key and secret."""
-        sig = '%s&' % escape(consumer.secret)
-        if token:
-            sig = sig + escape(token.secret)
+        sig = signing_key(consumer, token)
         return sig, sig
 
     def build_signature(self, oauth_request, consumer, token):
@@ -1,8 +1,7 @@
-import httplib
-import urllib2
 import urllib
 import time
 import oauth2 as oauth
+import transport
 
 from django.conf import settings
 
@@ -32,7 +31,7 @@ class GoogleOAuthClient(oauth.OAuthClient):
         params = oauth_request.parameters
         data = urllib.urlencode(params)
         full_url='%s?%s'%(self.request_token_url, data)
-        response = urllib2.urlopen(full_url)
+        response = transport.urlopen(full_url)
         return oauth.OAuthToken.from_string(response.read())
     
     def authorize_token_url(self, token, callback_url=None,):
@@ -43,7 +42,7 @@ class GoogleOAuthClient(oauth.OAuthClient):
         data = urllib.urlencode(params)
         full_url='%s?%s'%(self.authorization_url, data)
         return full_url
-        response = urllib2.urlopen(full_url)
+        response = transport.urlopen(full_url)
         return oauth.OAuthToken.from_string(response.read())
 
     def fetch_access_token(self, token):
@@ -52,7 +51,7 @@ class GoogleOAuthClient(oauth.OAuthClient):
         params = oauth_request.parameters
         data = urllib.urlencode(params)
         full_url='%s?%s'%(self.access_token_url, data)
-        response = urllib2.urlopen(full_url)
+        response = transport.urlopen(full_url)
         return oauth.OAuthToken.from_string(response.read())
 
 
@@ -63,7 +62,7 @@ class GoogleOAuthClient(oauth.OAuthClient):
         data = urllib.urlencode(params)
         full_url='%s?%s'%(url, data)
         #print full_url
-        response = urllib2.urlopen(full_url)
+        response = transport.urlopen(full_url)
         return response
 
 def run_example():
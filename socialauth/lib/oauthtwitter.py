@@ -14,6 +14,12 @@ __author__ = "Hameedullah Khan <hameed@hameedkhan.net>"
 __version__ = "0.1"
 
 
+import cgi
+import urllib
+import urllib2
+import urlparse
+from StringIO import StringIO
+
 from twitter import Api, User
 try:
     import json as simplejson
@@ -21,6 +27,7 @@ except:
     from django.utils import simplejson
 
 from oauth import oauth
+import transport
 
 
 
@@ -32,6 +39,10 @@ SIGNIN_URL = 'http://twitter.com/oauth/authenticate'
 
 
 class OAuthApi(Api):
+    # Seconds GET responses are cached, by URL without the query string.
+    # Other endpoints use the cache timeout (see SetCacheTimeout); 0 disables.
+    ENDPOINT_CACHE_TIMEOUTS = {}
+
     def __init__(self, consumer_key, consumer_secret, access_token=None):
         if access_token:
             Api.__init__(self,access_token.key, access_token.secret)
@@ -40,9 +51,33 @@ class OAuthApi(Api):
         self._Consumer = oauth.OAuthConsumer(consumer_key, consumer_secret)
         self._signature_method = oauth.OAuthSignatureMethod_HMAC_SHA1()
         self._access_token = access_token
+        self._endpoint_cache_timeouts = dict(self.ENDPOINT_CACHE_TIMEOUTS)
+
+    def SetEndpointCacheTimeout(self, url, cache_timeout):
+        '''Override the cache timeout for GETs of one endpoint.
+
+        Args:
+          url: the endpoint URL, without a query string
+          cache_timeout: time, in seconds, that responses should be reused
+        '''
+        self._endpoint_cache_timeouts[url] = cache_timeout
+
+    def _GetCacheKey(self, url, parameters):
+        '''Key a GET by access token and URL, leaving out the oauth_* parameters.'''
+        scheme, netloc, path, query, fragment = urlparse.urlsplit(url)
+        params = cgi.parse_qsl(query, keep_blank_values=True)
+        params.extend([(k, v) for k, v in parameters.items() if v is not None])
+        params = [(self._Encode(k), self._Encode(v)) for k, v in params
+                  if not k.startswith('oauth_')]
+        params.sort()
+        token_key = self._access_token and self._access_token.key or ''
+        return '%s:%s://%s%s?%s' % (token_key, scheme, netloc.lower(), path,
+                                    urllib.urlencode(params))
 
 
     def _GetOpener(self):
+        if self._urllib is urllib2:
+            return transport.Opener()
         opener = self._urllib.build_opener()
         return opener
 
@@ -50,7 +85,8 @@ class OAuthApi(Api):
                     url,
                     post_data=None,
                     parameters=None,
-                    no_cache=None):
+                    no_cache=None,
+                    stream=False):
         '''Fetch a URL, optionally caching for a specified time.
     
         Args:
@@ -61,9 +97,13 @@ class OAuthApi(Api):
             A dict whose key/value pairs should encoded and added 
             to the query string. [OPTIONAL]
           no_cache: If true, overrides the cache on the current request
+          stream:
+            If true, return a file-like object to read the body from, which
+            the caller must close. [OPTIONAL]
     
         Returns:
-          A string containing the body of the response.
+          A string containing the body of the response, or a file-like
+          object if stream is true.
         '''
         # Build the extra parameters dict
         extra_params = {}
@@ -83,6 +123,19 @@ class OAuthApi(Api):
             extra_params.update(post_data)
         else:
             http_method = "GET"
+
+        # Answer GETs from the cache without signing or fetching anything
+        key = None
+        if not post_data and not no_cache and self._cache:
+            cache_timeout = self._endpoint_cache_timeouts.get(url.split('?', 1)[0],
+                                                              self._cache_timeout)
+            if cache_timeout:
+                key = self._GetCacheKey(url, extra_params)
+                url_data = self._GetCached(key, cache_timeout)
+                if url_data is not None:
+                    if stream:
+                        return StringIO(url_data)
+                    return url_data
         
         req = self._makeOAuthRequest(url, parameters=extra_params, 
                                                     http_method=http_method)
@@ -101,34 +154,19 @@ class OAuthApi(Api):
             url = req.to_url()
             encoded_post_data = ""
             
-        no_cache=True
-        # Open and return the URL immediately if we're not going to cache
-        # OR we are posting data
-        if encoded_post_data or no_cache:
-          if encoded_post_data:
-              url_data = opener.open(url, encoded_post_data).read()
-          else:
-              url_data = opener.open(url).read()
-          opener.close()
+        if stream:
+            response = self._OpenStream(opener, url, encoded_post_data or None)
+            if key is not None:
+                return self._StreamThroughCache(response, key, cache_timeout)
+            return response
+        if encoded_post_data:
+            url_data = opener.open(url, encoded_post_data).read()
         else:
-          # Unique keys are a combination of the url and the username
-          if self._username:
-            key = self._username + ':' + url
-          else:
-            key = url
-    
-          # See if it has been cached before
-          last_cached = self._cache.GetCachedTime(key)
-    
-          # If the cached version is outdated then fetch another and store it
-          if not last_cached or time.time() >= last_cached + self._cache_timeout:
             url_data = opener.open(url).read()
-            opener.close()
-            self._cache.Set(key, url_data)
-          else:
-            url_data = self._cache.Get(key)
-    
-        # Always return the latest version
+        opener.close()
+
+        if key is not None:
+            self._SetCached(key, url_data, cache_timeout)
         return url_data
     
     def _makeOAuthRequest(self, url, token=None,
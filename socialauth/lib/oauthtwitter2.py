@@ -1,8 +1,7 @@
-import httplib
-import urllib2
 import urllib
 import time
 import oauth.oauth as oauth
+import transport
 
 from django.conf import settings
 
@@ -35,7 +34,7 @@ class TwitterOAuthClient(oauth.OAuthClient):
         params = oauth_request.parameters
         data = urllib.urlencode(params)
         full_url='%s?%s'%(self.request_token_url, data)
-        response = urllib2.urlopen(full_url)
+        response = transport.urlopen(full_url)
         return oauth.OAuthToken.from_string(response.read())
     
     def authorize_token_url(self, token, callback_url=None):
@@ -52,7 +51,7 @@ class TwitterOAuthClient(oauth.OAuthClient):
         params = oauth_request.parameters
         data = urllib.urlencode(params)
         full_url='%s?%s'%(self.access_token_url, data)
-        response = urllib2.urlopen(full_url)
+        response = transport.urlopen(full_url)
         return oauth.OAuthToken.from_string(response.read())
 
 
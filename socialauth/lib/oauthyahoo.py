@@ -1,8 +1,7 @@
-import httplib
-import urllib2
 import urllib
 import time
 import oauth.oauth as oauth
+import transport
 
 from django.conf import settings
 
@@ -30,7 +29,7 @@ class YahooOAuthClient(oauth.OAuthClient):
         params = oauth_request.parameters
         data = urllib.urlencode(params)
         full_url='%s?%s'%(self.request_token_url, data)
-        response = urllib2.urlopen(full_url)
+        response = transport.urlopen(full_url)
         return oauth.OAuthToken.from_string(response.read())
     
     def authorize_token_url(self, token, callback_url=None):
@@ -39,7 +38,7 @@ class YahooOAuthClient(oauth.OAuthClient):
         data = urllib.urlencode(params)
         full_url='%s?%s'%(self.authorization_url, data)
         return full_url
-        response = urllib2.urlopen(full_url)
+        response = transport.urlopen(full_url)
         return oauth.OAuthToken.from_string(response.read())
 
     def fetch_access_token(self, token, **kwargs):
@@ -48,7 +47,7 @@ class YahooOAuthClient(oauth.OAuthClient):
         params = oauth_request.parameters
         data = urllib.urlencode(params)
         full_url='%s?%s'%(self.access_token_url, data)
-        response = urllib2.urlopen(full_url)
+        response = transport.urlopen(full_url)
         return response
         #return oauth.OAuthToken.from_string(response.read())
 
@@ -59,7 +58,7 @@ class YahooOAuthClient(oauth.OAuthClient):
         params = oauth_request.parameters
         data = urllib.urlencode(params)
         full_url='%s?%s'%(url, data)
-        response = urllib2.urlopen(full_url)
+        response = transport.urlopen(full_url)
         return response
 
 def run_example():
@@ -0,0 +1,161 @@
+"""
+Deadlines, retries and circuit breaking for provider calls.
+
+Wrap a provider call with call():
+
+    token = resilience.call('twitter', client.fetch_request_token,
+                            callback=url, idempotent=True)
+
+The call, including its retries, must finish within the provider's deadline.
+Idempotent calls that fail with a network error or a 5xx response are
+retried with exponential backoff and full jitter. After failure_threshold
+consecutive failed calls the provider's circuit opens and further calls
+raise ProviderUnavailable at once, until reset_timeout seconds have passed
+and a trial call succeeds.
+
+Defaults come from these settings:
+
+    SOCIALAUTH_PROVIDER_DEADLINE           total seconds per call (10)
+    SOCIALAUTH_PROVIDER_RETRIES            extra attempts for idempotent calls (2)
+    SOCIALAUTH_PROVIDER_RETRY_BACKOFF      base backoff in seconds (0.2)
+    SOCIALAUTH_PROVIDER_FAILURE_THRESHOLD  failures that open the circuit (5)
+    SOCIALAUTH_PROVIDER_RESET_TIMEOUT      seconds the circuit stays open (30)
+
+and can be overridden for a provider in SOCIALAUTH_PROVIDER_POLICIES, e.g.
+{'linkedin': {'deadline': 5, 'retries': 1}}.
+"""
+import httplib
+import random
+import socket
+import threading
+import time
+import urllib2
+
+from django.conf import settings
+
+import transport
+
+DEFAULT_POLICY = {
+    'deadline': getattr(settings, 'SOCIALAUTH_PROVIDER_DEADLINE', 10),
+    'retries': getattr(settings, 'SOCIALAUTH_PROVIDER_RETRIES', 2),
+    'backoff': getattr(settings, 'SOCIALAUTH_PROVIDER_RETRY_BACKOFF', 0.2),
+    'failure_threshold': getattr(settings, 'SOCIALAUTH_PROVIDER_FAILURE_THRESHOLD', 5),
+    'reset_timeout': getattr(settings, 'SOCIALAUTH_PROVIDER_RESET_TIMEOUT', 30),
+}
+POLICIES = getattr(settings, 'SOCIALAUTH_PROVIDER_POLICIES', {})
+
+class ProviderUnavailable(Exception):
+    """The provider failed, timed out or has its circuit open."""
+
+def get_policy(provider):
+    policy = dict(DEFAULT_POLICY)
+    policy.update(POLICIES.get(provider, {}))
+    return policy
+
+def is_provider_failure(exc):
+    """True for errors that say the provider, not the request, is at fault."""
+    if isinstance(exc, urllib2.HTTPError):
+        return exc.code >= 500
+    return isinstance(exc, (socket.error, httplib.HTTPException, urllib2.URLError))
+
+class CircuitBreaker(object):
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.time() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        """True if a call may go through; lets one trial call when half-open."""
+        self._lock.acquire()
+        try:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return False
+        finally:
+            self._lock.release()
+
+    def record_success(self):
+        self._lock.acquire()
+        try:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+        finally:
+            self._lock.release()
+
+    def record_failure(self):
+        self._lock.acquire()
+        try:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+            self._trial = False
+        finally:
+            self._lock.release()
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(provider):
+    """Return the process-wide CircuitBreaker for provider."""
+    _breakers_lock.acquire()
+    try:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            policy = get_policy(provider)
+            breaker = _breakers[provider] = CircuitBreaker(
+                policy['failure_threshold'], policy['reset_timeout'])
+        return breaker
+    finally:
+        _breakers_lock.release()
+
+def call(provider, func, *args, **kwargs):
+    """
+    Call func(*args, **kwargs) under provider's policy. Pass idempotent=True
+    for calls that are safe to repeat. Provider failures are raised as
+    ProviderUnavailable; other errors (e.g. a 401) are raised unchanged.
+    """
+    idempotent = kwargs.pop('idempotent', False)
+    policy = get_policy(provider)
+    breaker = get_breaker(provider)
+    if not breaker.allow():
+        raise ProviderUnavailable('%s is unavailable (circuit open)' % provider)
+    deadline = time.time() + policy['deadline']
+    attempts = idempotent and policy['retries'] + 1 or 1
+    previous = transport.set_deadline(deadline)
+    try:
+        for attempt in range(attempts):
+            try:
+                result = func(*args, **kwargs)
+            except Exception, e:
+                if not is_provider_failure(e):
+                    # The provider answered; it is not degraded
+                    breaker.record_success()
+                    raise
+                delay = random.uniform(0, policy['backoff'] * 2 ** attempt)
+                if attempt + 1 == attempts or time.time() + delay >= deadline:
+                    breaker.record_failure()
+                    raise ProviderUnavailable('%s failed: %s' % (provider, e))
+                time.sleep(delay)
+            else:
+                breaker.record_success()
+                return result
+    finally:
+        transport.set_deadline(previous)
@@ -0,0 +1,515 @@
+"""
+Shared HTTP transport for the provider clients.
+
+Every client (Twitter, Google, Yahoo, LinkedIn, Facebook) sends its requests
+through the process-wide Transport returned by get_transport(), which keeps a
+small pool of idle keep-alive connections per (scheme, host, port). Logins
+then reuse an open TCP/TLS connection to the provider instead of doing a new
+handshake for every token exchange and profile fetch.
+
+Settings:
+
+    SOCIALAUTH_HTTP_CONNECT_TIMEOUT  seconds to establish a connection (5)
+    SOCIALAUTH_HTTP_READ_TIMEOUT     seconds to wait on a socket read (15)
+    SOCIALAUTH_HTTP_POOL_SIZE        idle connections kept per host (4)
+    SOCIALAUTH_HTTP_MAX_CONNECTIONS  connections open at once per host (10);
+                                     further requests wait for one to free up
+
+A thread can also set an absolute deadline with set_deadline(); every socket
+operation is then limited to the time left, and requests started after the
+deadline raise DeadlineExceeded, as do reads of a response body that is
+still arriving when it passes.
+
+urlopen() follows redirects like urllib2.urlopen. Requests to hosts that the
+environment says to reach through a proxy (http_proxy, https_proxy, no_proxy)
+are sent with urllib2 through that proxy, without pooling.
+
+Responses are normally read in full. With stream=True the body is read from
+the socket as the caller consumes it, and the connection goes back to the
+pool once the body has been read to the end.
+"""
+import httplib
+import select
+import socket
+import threading
+import time
+import urllib
+import urllib2
+import urlparse
+from StringIO import StringIO
+
+try:
+    import ssl
+except ImportError:
+    ssl = None
+
+from django.conf import settings
+
+CONNECT_TIMEOUT = getattr(settings, 'SOCIALAUTH_HTTP_CONNECT_TIMEOUT', 5)
+READ_TIMEOUT = getattr(settings, 'SOCIALAUTH_HTTP_READ_TIMEOUT', 15)
+POOL_SIZE = getattr(settings, 'SOCIALAUTH_HTTP_POOL_SIZE', 4)
+MAX_CONNECTIONS = getattr(settings, 'SOCIALAUTH_HTTP_MAX_CONNECTIONS', 10)
+MAX_REDIRECTS = 5
+
+# How far past the deadline a socket read may block before its timeout is
+# lowered again; re-setting it on every recv() would cost a syscall per byte
+# of the headers, which httplib reads one at a time
+DEADLINE_SLACK = 0.05
+
+# Redirects urlopen() follows; 301, 302 and 303 turn a POST into a GET
+REDIRECT_CODES = (301, 302, 303, 307)
+
+# Errors meaning a pooled connection was closed by the server while idle
+STALE_CONNECTION_ERRORS = (httplib.BadStatusLine, httplib.CannotSendRequest,
+                           socket.error)
+
+# Methods that may be sent again when a reused connection fails after the
+# request went out, since the server may have acted on it
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'TRACE')
+
+class PoolTimeout(socket.timeout):
+    """No connection to the host became free within the connect timeout."""
+
+class DeadlineExceeded(socket.timeout):
+    """The deadline set with set_deadline() has passed."""
+
+_local = threading.local()
+
+def set_deadline(deadline):
+    """
+    Set the time.time() by which this thread's requests must complete, or None
+    for no deadline. Returns the previous deadline.
+    """
+    previous = getattr(_local, 'deadline', None)
+    _local.deadline = deadline
+    return previous
+
+def time_left():
+    """Seconds left before this thread's deadline, or None."""
+    deadline = getattr(_local, 'deadline', None)
+    if deadline is None:
+        return None
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise DeadlineExceeded('Provider request deadline exceeded')
+    return remaining
+
+def _cap(timeout, remaining):
+    if remaining is None:
+        return timeout
+    return min(timeout, remaining)
+
+def raise_for_server_error(response):
+    """
+    Raise urllib2.HTTPError if response is a 5xx, so that callers of request()
+    see provider failures as urlopen() callers do. Returns response.
+    """
+    if response.status >= 500:
+        raise urllib2.HTTPError(response.url, response.status, response.reason,
+                                response.headers, response)
+    return response
+
+class _DeadlineSocket(object):
+    """
+    Wraps a connection's socket so that every read is limited to the time
+    left before the thread's deadline, however slowly the body arrives.
+    """
+    def __init__(self, sock, read_timeout):
+        self._sock = sock
+        self._read_timeout = read_timeout
+        self._timeout = sock.gettimeout()
+
+    def settimeout(self, timeout):
+        self._timeout = timeout
+        self._sock.settimeout(timeout)
+
+    def recv(self, *args):
+        remaining = time_left()
+        if remaining is None:
+            if self._timeout != self._read_timeout:
+                self.settimeout(self._read_timeout)
+        elif self._timeout is None or self._timeout > remaining + DEADLINE_SLACK:
+            self.settimeout(_cap(self._read_timeout, remaining))
+        return self._sock.recv(*args)
+
+    def makefile(self, mode='r', bufsize=-1):
+        # httplib reads responses through this file, and so through recv()
+        return socket._fileobject(self, mode, bufsize)
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+def _is_dropped(conn):
+    """True if an idle connection has been closed by the server."""
+    if conn.sock is None:
+        return True
+    try:
+        # An idle keep-alive socket only becomes readable at EOF
+        return bool(select.select([conn.sock], [], [], 0)[0])
+    except (select.error, socket.error, ValueError):
+        return True
+
+def _ssl_context():
+    # One context for all connections, so certificates are loaded once
+    if ssl is not None and hasattr(ssl, 'create_default_context'):
+        return ssl.create_default_context()
+    return None
+
+class Response(object):
+    """A fully read response, with the interface of urllib2's responses."""
+    def __init__(self, url, status, reason, headers, body):
+        self.url = url
+        self.status = self.code = status
+        self.reason = self.msg = reason
+        self.headers = headers
+        self.body = body
+        self._fp = StringIO(body)
+
+    def read(self, amt=None):
+        if amt is None:
+            return self._fp.read()
+        return self._fp.read(amt)
+
+    def readline(self):
+        return self._fp.readline()
+
+    def info(self):
+        return self.headers
+
+    def getcode(self):
+        return self.status
+
+    def geturl(self):
+        return self.url
+
+    def close(self):
+        self._fp.close()
+
+class StreamingResponse(object):
+    """
+    A response whose body is read from the connection as it is consumed. The
+    connection is given back to the pool once the body has been read to the
+    end, and closed if the response is closed before that.
+    """
+    def __init__(self, url, response, pool, conn):
+        self.url = url
+        self.status = self.code = response.status
+        self.reason = self.msg = response.reason
+        self.headers = response.msg
+        self._response = response
+        self._pool = pool
+        self._conn = conn
+        if response.isclosed():
+            self._release()
+
+    def read(self, amt=None):
+        if self._conn is None:
+            return ''
+        try:
+            if amt is None:
+                data = self._response.read()
+            else:
+                data = self._response.read(amt)
+        except:
+            self.close()
+            raise
+        if self._response.isclosed():
+            self._release()
+        return data
+
+    def _release(self):
+        conn, self._conn = self._conn, None
+        if self._response.will_close:
+            self._pool.discard(conn)
+        else:
+            self._pool.put(conn)
+
+    def info(self):
+        return self.headers
+
+    def getcode(self):
+        return self.status
+
+    def geturl(self):
+        return self.url
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            # The rest of the body is still on the wire
+            self._response.close()
+            self._pool.discard(conn)
+
+class ConnectionPool(object):
+    """
+    Keep-alive connections to one (scheme, host, port). At most max_size idle
+    connections are kept, and at most max_connections are in use at once.
+    """
+    def __init__(self, scheme, host, port=None, max_size=POOL_SIZE,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 ssl_context=None, max_connections=MAX_CONNECTIONS):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.max_size = max_size
+        self.max_connections = max_connections
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.ssl_context = ssl_context
+        self._idle = []
+        self._in_use = 0
+        self._lock = threading.Condition(threading.Lock())
+        self.created = 0
+
+    def new_connection(self, remaining=None):
+        timeout = _cap(self.connect_timeout, remaining)
+        if self.scheme == 'https':
+            kwargs = {}
+            if self.ssl_context is not None:
+                kwargs['context'] = self.ssl_context
+            conn = httplib.HTTPSConnection(self.host, self.port,
+                                           timeout=timeout, **kwargs)
+        else:
+            conn = httplib.HTTPConnection(self.host, self.port, timeout=timeout)
+        conn.connect()
+        conn.sock = _DeadlineSocket(conn.sock, self.read_timeout)
+        self.created += 1
+        return conn
+
+    def get(self, remaining=None):
+        """
+        Return (connection, reused), waiting and connecting for no longer than
+        remaining seconds if given. Every connection handed out must be given
+        back with put() or discard().
+        """
+        self._lock.acquire()
+        try:
+            deadline = time.time() + _cap(self.connect_timeout, remaining)
+            while self.max_connections and self._in_use >= self.max_connections:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PoolTimeout('No free connection to %s' % self.host)
+                self._lock.wait(remaining)
+            self._in_use += 1
+            while self._idle:
+                conn = self._idle.pop()
+                if not _is_dropped(conn):
+                    return conn, True
+                conn.close()
+        finally:
+            self._lock.release()
+        try:
+            return self.new_connection(remaining), False
+        except:
+            self.discard(None)
+            raise
+
+    def put(self, conn):
+        """Return a connection that can serve another request."""
+        self._lock.acquire()
+        try:
+            self._in_use -= 1
+            self._lock.notify()
+            if len(self._idle) < self.max_size:
+                self._idle.append(conn)
+                return
+        finally:
+            self._lock.release()
+        conn.close()
+
+    def discard(self, conn):
+        """Close a connection that cannot be reused."""
+        self._lock.acquire()
+        try:
+            self._in_use -= 1
+            self._lock.notify()
+        finally:
+            self._lock.release()
+        if conn is not None:
+            conn.close()
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            idle, self._idle = self._idle, []
+        finally:
+            self._lock.release()
+        for conn in idle:
+            conn.close()
+
+class _NoRedirect(urllib2.HTTPRedirectHandler):
+    """Hands 3xx responses back to the caller, as the pooled path does."""
+    def redirect_request(self, *args):
+        return None
+
+class Transport(object):
+    def __init__(self, max_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT, max_connections=MAX_CONNECTIONS,
+                 proxies=None):
+        if proxies is None:
+            proxies = urllib.getproxies()
+        self.proxies = proxies
+        self.max_size = max_size
+        self.max_connections = max_connections
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.ssl_context = _ssl_context()
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def get_pool(self, scheme, host, port=None):
+        key = (scheme, host, port)
+        self._lock.acquire()
+        try:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = self._pools[key] = ConnectionPool(scheme, host, port,
+                    self.max_size, self.connect_timeout, self.read_timeout,
+                    self.ssl_context, self.max_connections)
+            return pool
+        finally:
+            self._lock.release()
+
+    def request(self, method, url, body=None, headers=None, stream=False):
+        """
+        Send a request and return its Response, whatever the status. The body
+        is read in full so that the connection can go back to the pool, unless
+        stream is true: a StreamingResponse is then returned, which must be
+        read to the end or closed.
+        """
+        scheme, netloc, path, query, fragment = urlparse.urlsplit(url)
+        if scheme not in ('http', 'https'):
+            raise ValueError('Unsupported URL scheme: %r' % url)
+        host, port = netloc, None
+        if ':' in netloc:
+            host, port = netloc.rsplit(':', 1)
+            port = int(port)
+        target = path or '/'
+        if query:
+            target += '?' + query
+        headers = dict(headers or {})
+        if self.proxies.get(scheme) and not urllib.proxy_bypass(host):
+            return self._proxy_request(method, url, body, headers)
+        pool = self.get_pool(scheme, host, port)
+        while True:
+            remaining = time_left()
+            conn, reused = pool.get(remaining)
+            sent = False
+            try:
+                conn.sock.settimeout(_cap(self.read_timeout, remaining))
+                conn.request(method, target, body, headers)
+                sent = True
+                response = conn.getresponse()
+                if not stream:
+                    data = response.read()
+            except socket.timeout:
+                pool.discard(conn)
+                raise
+            except STALE_CONNECTION_ERRORS:
+                pool.discard(conn)
+                if reused and (not sent or method in IDEMPOTENT_METHODS):
+                    # The server dropped the idle connection; retry on a new one
+                    continue
+                raise
+            except:
+                pool.discard(conn)
+                raise
+            break
+        if stream:
+            return StreamingResponse(url, response, pool, conn)
+        if response.will_close:
+            pool.discard(conn)
+        else:
+            pool.put(conn)
+        return Response(url, response.status, response.reason, response.msg, data)
+
+    def _proxy_request(self, method, url, body, headers):
+        """Send a request through the environment's proxy with urllib2."""
+        request = urllib2.Request(url, body, headers)
+        request.get_method = lambda: method
+        opener = urllib2.build_opener(urllib2.ProxyHandler(self.proxies), _NoRedirect)
+        try:
+            fp = opener.open(request, timeout=_cap(self.read_timeout, time_left()))
+        except urllib2.HTTPError, e:
+            fp = e
+        try:
+            return Response(url, fp.code, fp.msg, fp.info(), fp.read())
+        finally:
+            fp.close()
+
+    def urlopen(self, url, data=None, headers=None, stream=False):
+        """
+        Like urllib2.urlopen: POST if data is given, redirects followed (up to
+        MAX_REDIRECTS), and HTTPError for any other status from 300 up.
+        """
+        headers = dict(headers or {})
+        if data is None:
+            method = 'GET'
+        else:
+            method = 'POST'
+            headers.setdefault('Content-Type', 'application/x-www-form-urlencoded')
+        for redirects in range(MAX_REDIRECTS + 1):
+            response = self.request(method, url, data, headers, stream)
+            location = response.headers.get('location')
+            if (response.status not in REDIRECT_CODES or not location
+                or redirects == MAX_REDIRECTS):
+                break
+            # Read the body so that the connection can be reused
+            response.read()
+            response.close()
+            url = urlparse.urljoin(url, location)
+            if response.status != 307:
+                method, data = 'GET', None
+                headers.pop('Content-Type', None)
+        if response.status >= 300:
+            if stream:
+                response = Response(url, response.status, response.reason,
+                                    response.headers, response.read())
+            raise urllib2.HTTPError(url, response.status, response.reason,
+                                    response.headers, response)
+        return response
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            pools, self._pools = self._pools.values(), {}
+        finally:
+            self._lock.release()
+        for pool in pools:
+            pool.close()
+
+class Opener(object):
+    """
+    Stands in for a urllib2 opener (open/close/addheaders) while sending
+    requests through the shared transport.
+    """
+    def __init__(self, addheaders=None, transport=None):
+        self.addheaders = list(addheaders or [])
+        self.transport = transport or get_transport()
+
+    def open(self, url, data=None, stream=False):
+        return self.transport.urlopen(url, data, dict(self.addheaders), stream)
+
+    def close(self):
+        pass
+
+_transport = None
+_transport_lock = threading.Lock()
+
+def get_transport():
+    """Return the process-wide Transport."""
+    global _transport
+    if _transport is None:
+        _transport_lock.acquire()
+        try:
+            if _transport is None:
+                _transport = Transport()
+        finally:
+            _transport_lock.release()
+    return _transport
+
+def request(method, url, body=None, headers=None, stream=False):
+    return get_transport().request(method, url, body, headers, stream)
+
+def urlopen(url, data=None, headers=None, stream=False):
+    return get_transport().urlopen(url, data, headers, stream)
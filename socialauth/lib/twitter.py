@@ -30,7 +30,9 @@ except:
     from django.utils import simplejson
 import sys
 import tempfile
+from StringIO import StringIO
 import textwrap
+import threading
 import time
 import urllib
 import urllib2
@@ -41,6 +43,15 @@ try:
 except ImportError:
   from md5 import md5
 
+try:
+  from collections import OrderedDict
+except ImportError:
+  from django.utils.datastructures import SortedDict as OrderedDict
+
+import futures
+import jsonstream
+import transport
+
 
 CHARACTER_LIMIT = 140
 
@@ -54,6 +65,22 @@ class TwitterError(Exception):
     return self.args[0]
 
 
+def _GetSlotState(self):
+  # Classes with __slots__ but no __getstate__ can only be pickled with
+  # protocol 2, so the models hand pickle their slot values as a dict
+  state = {}
+  for name in self.__slots__:
+    try:
+      state[name] = getattr(self, name)
+    except AttributeError:
+      pass
+  return state
+
+def _SetSlotState(self, state):
+  for name, value in state.items():
+    setattr(self, name, value)
+
+
 class Status(object):
   '''A class representing the Status structure used by the twitter API.
 
@@ -72,6 +99,12 @@ class Status(object):
     status.relative_created_at # read only
     status.user
   '''
+  __slots__ = ('_created_at', '_favorited', '_id', '_text', '_user', '_now',
+               '_in_reply_to_screen_name', '_in_reply_to_user_id',
+               '_in_reply_to_status_id', '_truncated', '_source')
+  __getstate__ = _GetSlotState
+  __setstate__ = _SetSlotState
+
   def __init__(self,
                created_at=None,
                favorited=None,
@@ -407,20 +440,18 @@ class Status(object):
     Returns:
       A twitter.Status instance
     '''
-    if 'user' in data:
-      user = User.NewFromJsonDict(data['user'])
-    else:
-      user = None
-    return Status(created_at=data.get('created_at', None),
-                  favorited=data.get('favorited', None),
-                  id=data.get('id', None),
-                  text=data.get('text', None),
-                  in_reply_to_screen_name=data.get('in_reply_to_screen_name', None),
-                  in_reply_to_user_id=data.get('in_reply_to_user_id', None),
-                  in_reply_to_status_id=data.get('in_reply_to_status_id', None),
-                  truncated=data.get('truncated', None),
-                  source=data.get('source', None),
-                  user=user)
+    return _status_hydrator(data)
+
+  @staticmethod
+  def NewListFromJsonList(items):
+    '''Create new instances from a JSON list in one pass.
+
+    Args:
+      items: A list of JSON dicts, as converted from the JSON in the twitter API
+    Returns:
+      A list of twitter.Status instances
+    '''
+    return _status_hydrator.Many(items)
 
 
 class User(object):
@@ -450,6 +481,16 @@ class User(object):
     user.friends_count
     user.favourites_count
   '''
+  __slots__ = ('_id', '_name', '_screen_name', '_location', '_description',
+               '_url', '_profile_image_url', '_profile_background_tile',
+               '_profile_background_image_url', '_profile_sidebar_fill_color',
+               '_profile_background_color', '_profile_link_color',
+               '_profile_text_color', '_protected', '_utc_offset',
+               '_time_zone', '_status', '_friends_count', '_followers_count',
+               '_statuses_count', '_favourites_count')
+  __getstate__ = _GetSlotState
+  __setstate__ = _SetSlotState
+
   def __init__(self,
                id=None,
                name=None,
@@ -925,31 +966,18 @@ class User(object):
     Returns:
       A twitter.User instance
     '''
-    if 'status' in data:
-      status = Status.NewFromJsonDict(data['status'])
-    else:
-      status = None
-    return User(id=data.get('id', None),
-                name=data.get('name', None),
-                screen_name=data.get('screen_name', None),
-                location=data.get('location', None),
-                description=data.get('description', None),
-                statuses_count=data.get('statuses_count', None),
-                followers_count=data.get('followers_count', None),
-                favourites_count=data.get('favourites_count', None),
-                friends_count=data.get('friends_count', None),
-                profile_image_url=data.get('profile_image_url', None),
-                profile_background_tile = data.get('profile_background_tile', None),
-                profile_background_image_url = data.get('profile_background_image_url', None),
-                profile_sidebar_fill_color = data.get('profile_sidebar_fill_color', None),
-                profile_background_color = data.get('profile_background_color', None),
-                profile_link_color = data.get('profile_link_color', None),
-                profile_text_color = data.get('profile_text_color', None),
-                protected = data.get('protected', None),
-                utc_offset = data.get('utc_offset', None),
-                time_zone = data.get('time_zone', None),
-                url=data.get('url', None),
-                status=status)
+    return _user_hydrator(data)
+
+  @staticmethod
+  def NewListFromJsonList(items):
+    '''Create new instances from a JSON list in one pass.
+
+    Args:
+      items: A list of JSON dicts, as converted from the JSON in the twitter API
+    Returns:
+      A list of twitter.User instances
+    '''
+    return _user_hydrator.Many(items)
 
 class DirectMessage(object):
   '''A class representing the DirectMessage structure used by the twitter API.
@@ -965,6 +993,10 @@ class DirectMessage(object):
     direct_message.recipient_screen_name
     direct_message.text
   '''
+  __slots__ = ('_id', '_created_at', '_sender_id', '_sender_screen_name',
+               '_recipient_id', '_recipient_screen_name', '_text')
+  __getstate__ = _GetSlotState
+  __setstate__ = _SetSlotState
 
   def __init__(self,
                id=None,
@@ -1211,13 +1243,106 @@ class DirectMessage(object):
     Returns:
       A twitter.DirectMessage instance
     '''
-    return DirectMessage(created_at=data.get('created_at', None),
-                         recipient_id=data.get('recipient_id', None),
-                         sender_id=data.get('sender_id', None),
-                         text=data.get('text', None),
-                         sender_screen_name=data.get('sender_screen_name', None),
-                         id=data.get('id', None),
-                         recipient_screen_name=data.get('recipient_screen_name', None))
+    return _direct_message_hydrator(data)
+
+  @staticmethod
+  def NewListFromJsonList(items):
+    '''Create new instances from a JSON list in one pass.
+
+    Args:
+      items: A list of JSON dicts, as converted from the JSON in the twitter API
+    Returns:
+      A list of twitter.DirectMessage instances
+    '''
+    return _direct_message_hydrator.Many(items)
+
+
+class _Hydrator(object):
+  '''Builds model instances from JSON dicts, driven by a table of fields.
+
+  Each field is copied from the JSON key of the same name straight into the
+  model's slot, without going through __init__ and the property setters.
+  Nested objects are built with the hydrator of their own model.
+  '''
+  def __init__(self, model, fields, nested=(), defaults=()):
+    '''
+    Args:
+      model: The model class, which must define __slots__
+      fields: The JSON keys copied as they are, None when missing
+      nested: (key, hydrator name) pairs for JSON keys holding another model
+      defaults: (name, value) pairs for slots not set from the JSON
+    '''
+    self._model = model
+    self._fields = [(getattr(model, '_' + f).__set__, f) for f in fields]
+    self._nested = [(getattr(model, '_' + f).__set__, f, h) for f, h in nested]
+    self._defaults = [(getattr(model, '_' + f).__set__, v) for f, v in defaults]
+
+  def __call__(self, data):
+    return self.Many([data])[0]
+
+  def Many(self, items):
+    '''Return a list with a model instance for each JSON dict in items.'''
+    new = self._model.__new__
+    model = self._model
+    fields = self._fields
+    defaults = self._defaults
+    nested = [(set_field, key, []) for set_field, key, name in self._nested]
+    results = []
+    append = results.append
+    for data in items:
+      instance = new(model)
+      get = data.get
+      for set_field, key in fields:
+        set_field(instance, get(key))
+      for set_field, value in defaults:
+        set_field(instance, value)
+      for set_field, key, pending in nested:
+        if key in data:
+          pending.append((instance, data[key]))
+        else:
+          set_field(instance, None)
+      append(instance)
+    # Nested objects are built together, one batch per key
+    for (set_field, key, pending), (_, _, name) in zip(nested, self._nested):
+      if pending:
+        children = globals()[name].Many([child for _, child in pending])
+        for (instance, _), child in zip(pending, children):
+          set_field(instance, child)
+    return results
+
+  def Iter(self, items, batch_size=100):
+    '''Like Many, but for any iterable of JSON dicts, such as one being
+    decoded incrementally. Only batch_size dicts are held at a time.'''
+    batch = []
+    for data in items:
+      batch.append(data)
+      if len(batch) >= batch_size:
+        for instance in self.Many(batch):
+          yield instance
+        batch = []
+    for instance in self.Many(batch):
+      yield instance
+
+
+_status_hydrator = _Hydrator(Status,
+    ('created_at', 'favorited', 'id', 'text', 'in_reply_to_screen_name',
+     'in_reply_to_user_id', 'in_reply_to_status_id', 'truncated', 'source'),
+    nested=(('user', '_user_hydrator'),),
+    defaults=(('now', None),))
+
+_user_hydrator = _Hydrator(User,
+    ('id', 'name', 'screen_name', 'location', 'description', 'url',
+     'profile_image_url', 'profile_background_tile',
+     'profile_background_image_url', 'profile_sidebar_fill_color',
+     'profile_background_color', 'profile_link_color', 'profile_text_color',
+     'protected', 'utc_offset', 'time_zone', 'statuses_count',
+     'followers_count', 'friends_count', 'favourites_count'),
+    nested=(('status', '_status_hydrator'),))
+
+_direct_message_hydrator = _Hydrator(DirectMessage,
+    ('id', 'created_at', 'sender_id', 'sender_screen_name', 'recipient_id',
+     'recipient_screen_name', 'text'))
+
 
 class Api(object):
   '''A python interface into the Twitter API
@@ -1282,6 +1407,9 @@ class Api(object):
 
   DEFAULT_CACHE_TIMEOUT = 60 # cache for 1 minute
 
+  # Streamed responses larger than this are read through without being cached
+  MAX_CACHED_STREAM = 256 * 1024
+
   _API_REALM = 'Twitter API'
 
   def __init__(self,
@@ -1297,7 +1425,7 @@ class Api(object):
       input_encoding: The encoding used to encode input strings. [optional]
       request_header: A dictionary of additional HTTP request headers. [optional]
     '''
-    self._cache = _FileCache()
+    self._cache = GetDefaultCache()
     self._urllib = urllib2
     self._cache_timeout = Api.DEFAULT_CACHE_TIMEOUT
     self._InitializeRequestHeaders(request_headers)
@@ -1321,10 +1449,7 @@ class Api(object):
     if since_id:
       parameters['since_id'] = since_id
     url = 'http://twitter.com/statuses/public_timeline.json'
-    json = self._FetchUrl(url,  parameters=parameters)
-    data = simplejson.loads(json)
-    self._CheckForTwitterError(data)
-    return [Status.NewFromJsonDict(x) for x in data]
+    return self._FetchList(_status_hydrator, url, parameters=parameters)
 
   def GetFriendsTimeline(self,
                          user=None,
@@ -1371,12 +1496,10 @@ class Api(object):
       parameters['since'] = since
     if since_id:
       parameters['since_id'] = since_id
-    json = self._FetchUrl(url, parameters=parameters)
-    data = simplejson.loads(json)
-    self._CheckForTwitterError(data)
-    return [Status.NewFromJsonDict(x) for x in data]
+    return self._FetchList(_status_hydrator, url, parameters=parameters)
 
-  def GetUserTimeline(self, user=None, count=None, since=None, since_id=None):
+  def GetUserTimeline(self, user=None, count=None, since=None, since_id=None,
+                      page=None):
     '''Fetch the sequence of public twitter.Status messages for a single user.
 
     The twitter.Api instance must be authenticated if the user is private.
@@ -1392,6 +1515,7 @@ class Api(object):
       since_id:
         Returns only public statuses with an ID greater than (that is,
         more recent than) the specified ID. [Optional]
+      page: the page of results to retrieve, starting at 1 [optional]
 
     Returns:
       A sequence of twitter.Status instances, one for each message up to count
@@ -1408,16 +1532,30 @@ class Api(object):
       parameters['since'] = since
     if since_id:
       parameters['since_id'] = since_id
+    if page:
+      parameters['page'] = page
     if user:
       url = 'http://twitter.com/statuses/user_timeline/%s.json' % user
     elif not user and not self._username:
       raise TwitterError("User must be specified if API is not authenticated.")
     else:
       url = 'http://twitter.com/statuses/user_timeline.json'
-    json = self._FetchUrl(url, parameters=parameters)
-    data = simplejson.loads(json)
-    self._CheckForTwitterError(data)
-    return [Status.NewFromJsonDict(x) for x in data]
+    return self._FetchList(_status_hydrator, url, parameters=parameters)
+
+  def IterUserTimeline(self, user=None, count=None, since=None, since_id=None,
+                       prefetch=False):
+    '''Iterate over a user's timeline, page by page.
+
+    Takes the arguments of GetUserTimeline, with count being the number of
+    statuses per page, and prefetch as for IterPages.
+
+    Returns:
+      An iterator of twitter.Status instances
+    '''
+    def fetch(page):
+      return self.GetUserTimeline(user=user, count=count, since=since,
+                                  since_id=since_id, page=page)
+    return self.IterPages(fetch, prefetch=prefetch)
 
   def GetStatus(self, id):
     '''Returns a single status message.
@@ -1557,10 +1695,19 @@ class Api(object):
       parameters['since_id'] = since_id
     if page:
       parameters['page'] = page
-    json = self._FetchUrl(url, parameters=parameters)
-    data = simplejson.loads(json)
-    self._CheckForTwitterError(data)
-    return [Status.NewFromJsonDict(x) for x in data]
+    return self._FetchList(_status_hydrator, url, parameters=parameters)
+
+  def IterReplies(self, since=None, since_id=None, prefetch=False):
+    '''Iterate over the replies to the authenticating user, page by page.
+
+    Takes the arguments of GetReplies, and prefetch as for IterPages.
+
+    Returns:
+      An iterator of twitter.Status instances
+    '''
+    def fetch(page):
+      return self.GetReplies(since=since, since_id=since_id, page=page)
+    return self.IterPages(fetch, prefetch=prefetch)
 
   def GetFriends(self, user=None, page=None):
     '''Fetch the sequence of twitter.User instances, one for each friend.
@@ -1583,10 +1730,19 @@ class Api(object):
     parameters = {}
     if page:
       parameters['page'] = page
-    json = self._FetchUrl(url, parameters=parameters)
-    data = simplejson.loads(json)
-    self._CheckForTwitterError(data)
-    return [User.NewFromJsonDict(x) for x in data]
+    return self._FetchList(_user_hydrator, url, parameters=parameters)
+
+  def IterFriends(self, user=None, prefetch=False):
+    '''Iterate over the friends of a user, page by page.
+
+    Takes the arguments of GetFriends, and prefetch as for IterPages.
+
+    Returns:
+      An iterator of twitter.User instances
+    '''
+    def fetch(page):
+      return self.GetFriends(user=user, page=page)
+    return self.IterPages(fetch, prefetch=prefetch)
 
   def GetFollowers(self, page=None):
     '''Fetch the sequence of twitter.User instances, one for each follower
@@ -1602,10 +1758,19 @@ class Api(object):
     parameters = {}
     if page:
       parameters['page'] = page
-    json = self._FetchUrl(url, parameters=parameters)
-    data = simplejson.loads(json)
-    self._CheckForTwitterError(data)
-    return [User.NewFromJsonDict(x) for x in data]
+    return self._FetchList(_user_hydrator, url, parameters=parameters)
+
+  def IterFollowers(self, prefetch=False):
+    '''Iterate over the followers of the authenticating user, page by page.
+
+    Takes prefetch as for IterPages.
+
+    Returns:
+      An iterator of twitter.User instances
+    '''
+    def fetch(page):
+      return self.GetFollowers(page=page)
+    return self.IterPages(fetch, prefetch=prefetch)
 
   def GetFeatured(self):
     '''Fetch the sequence of twitter.User instances featured on twitter.com
@@ -1616,10 +1781,7 @@ class Api(object):
       A sequence of twitter.User instances
     '''
     url = 'http://twitter.com/statuses/featured.json'
-    json = self._FetchUrl(url)
-    data = simplejson.loads(json)
-    self._CheckForTwitterError(data)
-    return [User.NewFromJsonDict(x) for x in data]
+    return self._FetchList(_user_hydrator, url)
 
   def GetUser(self, user):
     '''Returns a single user.
@@ -1664,10 +1826,20 @@ class Api(object):
       parameters['since_id'] = since_id
     if page:
       parameters['page'] = page 
-    json = self._FetchUrl(url, parameters=parameters)
-    data = simplejson.loads(json)
-    self._CheckForTwitterError(data)
-    return [DirectMessage.NewFromJsonDict(x) for x in data]
+    return self._FetchList(_direct_message_hydrator, url, parameters=parameters)
+
+  def IterDirectMessages(self, since=None, since_id=None, prefetch=False):
+    '''Iterate over the direct messages sent to the authenticating user,
+    page by page.
+
+    Takes the arguments of GetDirectMessages, and prefetch as for IterPages.
+
+    Returns:
+      An iterator of twitter.DirectMessage instances
+    '''
+    def fetch(page):
+      return self.GetDirectMessages(since=since, since_id=since_id, page=page)
+    return self.IterPages(fetch, prefetch=prefetch)
 
   def PostDirectMessage(self, user, text):
     '''Post a twitter direct message from the authenticated user
@@ -1789,6 +1961,39 @@ class Api(object):
     self._CheckForTwitterError(data)
     return User.NewFromJsonDict(data)
 
+  def IterPages(self, fetch, prefetch=False):
+    '''Iterate over the items of a paged API call.
+
+    Pages 1, 2, ... are fetched as the items are consumed, and iteration
+    stops at the first empty page. Only the current page is kept in memory,
+    or the current and the next one with prefetch.
+
+    Args:
+      fetch:
+        A function taking a page number and returning that page as a list
+      prefetch:
+        If true, fetch the next page in the background while the current
+        one is consumed [optional]
+
+    Returns:
+      An iterator over the items of all the pages
+    '''
+    page = 1
+    if prefetch:
+      pending = futures.submit(fetch, page)
+    while True:
+      if prefetch:
+        items = pending.result()
+        pending = items and futures.submit(fetch, page + 1)
+      else:
+        items = fetch(page)
+      if not items:
+        return
+      for item in items:
+        yield item
+      del items
+      page += 1
+
   def SetCredentials(self, username, password):
     '''Set the username and password for this instance
 
@@ -1808,6 +2013,9 @@ class Api(object):
   def SetCache(self, cache):
     '''Override the default cache.  Set to None to prevent caching.
 
+    The default is a MemoryCache shared by the process; DjangoCache shares
+    responses between processes and _FileCache keeps them on disk.
+
     Args:
       cache: an instance that supports the same API as the  twitter._FileCache
     '''
@@ -1919,6 +2127,11 @@ class Api(object):
   def _GetOpener(self, url, username=None, password=None):
     if username and password:
       self._AddAuthorizationHeader(username, password)
+    if self._urllib is urllib2:
+      # Credentials are sent preemptively in the Authorization header, so the
+      # shared keep-alive transport can serve authenticated requests too
+      return transport.Opener(self._request_headers.items())
+    if username and password:
       handler = self._urllib.HTTPBasicAuthHandler()
       (scheme, netloc, path, params, query, fragment) = urlparse.urlparse(url)
       handler.add_password(Api._API_REALM, netloc, username, password)
@@ -1982,11 +2195,86 @@ class Api(object):
     if 'error' in data:
       raise TwitterError(data['error'])
 
+  def _GetCached(self, key, max_age=None):
+    '''Return the cached data for key if younger than max_age seconds, or None.
+
+    max_age defaults to the cache timeout.
+    '''
+    if max_age is None:
+      max_age = self._cache_timeout
+    get_fresh = getattr(self._cache, 'GetFresh', None)
+    if get_fresh is not None:
+      return get_fresh(key, max_age)
+    last_cached = self._cache.GetCachedTime(key)
+    if not last_cached or time.time() >= last_cached + max_age:
+      return None
+    return self._cache.Get(key)
+
+  def _SetCached(self, key, data, timeout=None):
+    '''Cache data for key, for no longer than it can be used.
+
+    timeout defaults to the cache timeout.
+    '''
+    if timeout is None:
+      timeout = self._cache_timeout
+    set_for = getattr(self._cache, 'SetFor', None)
+    if set_for is not None:
+      set_for(key, data, timeout)
+    else:
+      self._cache.Set(key, data)
+
+  def _StreamThroughCache(self, stream, key, timeout=None):
+    '''Wrap a streamed response so that, if small enough, it gets cached.
+
+    Args:
+      stream: The file-like response, as returned by _OpenStream
+      key: The cache key to store the body under
+      timeout: The cache timeout, defaults to the Api's [OPTIONAL]
+
+    Returns:
+      A file-like object reading from stream
+    '''
+    def store(data):
+      self._SetCached(key, data, timeout)
+    return _CachingStream(stream, store, self.MAX_CACHED_STREAM)
+
+  def _FetchList(self, hydrator, url, parameters=None):
+    '''Fetch a JSON list and build a model instance for each of its items.
+
+    The response is decoded incrementally and items are hydrated as they are
+    decoded, so the decoded list is never held in memory, nor is the body
+    unless it is small enough to be cached.
+
+    Args:
+      hydrator: The _Hydrator of the model
+      url: The URL to retrieve
+      parameters: Parameters added to the query string [OPTIONAL]
+
+    Returns:
+      A list of model instances
+    '''
+    stream = self._FetchUrl(url, parameters=parameters, stream=True)
+    try:
+      try:
+        return list(hydrator.Iter(jsonstream.iter_array(stream)))
+      except jsonstream.NotAnArray, e:
+        self._CheckForTwitterError(e.value)
+        raise TwitterError('Expected a JSON list from %s' % url)
+    finally:
+      stream.close()
+
+  def _OpenStream(self, opener, url, data=None):
+    '''Open a URL, leaving the body to be read from the returned response.'''
+    if isinstance(opener, transport.Opener):
+      return opener.open(url, data, stream=True)
+    return opener.open(url, data)
+
   def _FetchUrl(self,
                 url,
                 post_data=None,
                 parameters=None,
-                no_cache=None):
+                no_cache=None,
+                stream=False):
     '''Fetch a URL, optionally caching for a specified time.
 
     Args:
@@ -1997,9 +2285,13 @@ class Api(object):
         A dict whose key/value pairs should encoded and added 
         to the query string. [OPTIONAL]
       no_cache: If true, overrides the cache on the current request
+      stream:
+        If true, return a file-like object to read the body from, which
+        the caller must close. [OPTIONAL]
 
     Returns:
-      A string containing the body of the response.
+      A string containing the body of the response, or a file-like
+      object if stream is true.
     '''
     # Build the extra parameters dict
     extra_params = {}
@@ -2018,6 +2310,8 @@ class Api(object):
 
     # Open and return the URL immediately if we're not going to cache
     if encoded_post_data or no_cache or not self._cache or not self._cache_timeout:
+      if stream:
+        return self._OpenStream(opener, url, encoded_post_data)
       url_data = opener.open(url, encoded_post_data).read()
       opener.close()
     else:
@@ -2027,21 +2321,221 @@ class Api(object):
       else:
         key = url
 
-      # See if it has been cached before
-      last_cached = self._cache.GetCachedTime(key)
+      # See if it has been cached recently
+      url_data = self._GetCached(key)
 
-      # If the cached version is outdated then fetch another and store it
-      if not last_cached or time.time() >= last_cached + self._cache_timeout:
+      # If the cached version is missing or outdated then fetch another and store it
+      if url_data is None and stream:
+        return self._StreamThroughCache(
+          self._OpenStream(opener, url, encoded_post_data), key)
+      if url_data is None:
         url_data = opener.open(url, encoded_post_data).read()
         opener.close()
-        self._cache.Set(key, url_data)
-      else:
-        url_data = self._cache.Get(key)
+        self._SetCached(key, url_data)
 
     # Always return the latest version
+    if stream:
+      return StringIO(url_data)
     return url_data
 
 
+class _CachingStream(object):
+  '''Reads a response through, keeping a copy of the body while it is small.
+
+  On close, a body read to the end without growing past max_size is passed
+  to store; a larger one is not kept at all.
+  '''
+
+  def __init__(self, fp, store, max_size):
+    self._fp = fp
+    self._store = store
+    self._max_size = max_size
+    self._chunks = []
+    self._size = 0
+    self._eof = False
+
+  def read(self, size=-1):
+    data = self._fp.read(size)
+    if not data or size < 0:
+      self._eof = True
+    if data and self._chunks is not None:
+      self._size += len(data)
+      if self._size > self._max_size:
+        self._chunks = None
+      else:
+        self._chunks.append(data)
+    return data
+
+  def close(self):
+    try:
+      # Decoders stop at the end of the document, before the end of the body
+      while self._chunks is not None and not self._eof:
+        self.read(jsonstream.CHUNK_SIZE)
+      if self._chunks is not None:
+        self._store(''.join(self._chunks))
+    finally:
+      self._chunks = None
+      self._fp.close()
+
+
+class MemoryCache(object):
+  '''A bounded, thread-safe, in-process LRU cache for twitter.Api.
+
+  Implements the twitter._FileCache API, plus GetFresh which Api uses to
+  check and read an entry with a single lookup, and SetFor which Api uses
+  to keep an entry only as long as its cache timeout.
+
+  Args:
+    max_bytes: the total size of the responses kept before the least
+               recently used ones are dropped; larger responses are not kept
+    timeout: seconds after which an entry stored with Set is dropped
+  '''
+
+  def __init__(self, max_bytes=4 * 1024 * 1024, timeout=Api.DEFAULT_CACHE_TIMEOUT):
+    self._max_bytes = max_bytes
+    self._timeout = timeout
+    self._bytes = 0
+    # key -> (cached_time, data, expires, size)
+    self._data = OrderedDict()
+    self._lock = threading.Lock()
+
+  def _Lookup(self, key):
+    # Returns (cached_time, data) or None; the caller holds the lock
+    try:
+      entry = self._data.pop(key)
+    except KeyError:
+      return None
+    if time.time() >= entry[2]:
+      self._bytes -= entry[3]
+      return None
+    self._data[key] = entry
+    return entry[:2]
+
+  def _Pop(self, key):
+    # The caller holds the lock
+    entry = self._data.pop(key, None)
+    if entry is not None:
+      self._bytes -= entry[3]
+
+  def Get(self, key):
+    entry = self.GetEntry(key)
+    return entry and entry[1]
+
+  def GetCachedTime(self, key):
+    entry = self.GetEntry(key)
+    return entry and entry[0]
+
+  def GetEntry(self, key):
+    self._lock.acquire()
+    try:
+      return self._Lookup(key)
+    finally:
+      self._lock.release()
+
+  def GetFresh(self, key, max_age):
+    '''Return the data for key if it was cached less than max_age seconds ago.'''
+    entry = self.GetEntry(key)
+    if entry and time.time() < entry[0] + max_age:
+      return entry[1]
+    return None
+
+  def Set(self, key, data):
+    self.SetFor(key, data, self._timeout)
+
+  def SetFor(self, key, data, timeout):
+    '''Store data for key, to be dropped after timeout seconds.'''
+    size = len(data)
+    now = time.time()
+    self._lock.acquire()
+    try:
+      self._Pop(key)
+      if size > self._max_bytes or timeout <= 0:
+        return
+      while self._data and self._bytes + size > self._max_bytes:
+        self._Pop(iter(self._data).next())
+      self._data[key] = (now, data, now + timeout, size)
+      self._bytes += size
+    finally:
+      self._lock.release()
+
+  def Remove(self, key):
+    self._lock.acquire()
+    try:
+      self._Pop(key)
+    finally:
+      self._lock.release()
+
+  def Clear(self):
+    self._lock.acquire()
+    try:
+      self._data.clear()
+      self._bytes = 0
+    finally:
+      self._lock.release()
+
+
+class DjangoCache(object):
+  '''Adapts a Django cache backend to the twitter._FileCache API.
+
+  Responses are shared by every process using the backend (e.g. memcached).
+
+  Args:
+    cache: a Django cache backend; defaults to django.core.cache.cache
+    prefix: prepended to the hashed keys
+    timeout: seconds the backend keeps an entry
+  '''
+
+  def __init__(self, cache=None, prefix='twitter', timeout=Api.DEFAULT_CACHE_TIMEOUT):
+    if cache is None:
+      from django.core.cache import cache
+    self._cache = cache
+    self._prefix = prefix
+    self._timeout = timeout
+
+  def _Key(self, key):
+    if isinstance(key, unicode):
+      key = key.encode('utf-8')
+    return '%s:%s' % (self._prefix, md5(key).hexdigest())
+
+  def GetEntry(self, key):
+    return self._cache.get(self._Key(key))
+
+  def Get(self, key):
+    entry = self.GetEntry(key)
+    return entry and entry[1]
+
+  def GetCachedTime(self, key):
+    entry = self.GetEntry(key)
+    return entry and entry[0]
+
+  def GetFresh(self, key, max_age):
+    '''Return the data for key if it was cached less than max_age seconds ago.'''
+    entry = self.GetEntry(key)
+    if entry and time.time() < entry[0] + max_age:
+      return entry[1]
+    return None
+
+  def Set(self, key, data):
+    self.SetFor(key, data, self._timeout)
+
+  def SetFor(self, key, data, timeout):
+    '''Store data for key, to be dropped after timeout seconds.'''
+    self._cache.set(self._Key(key), (time.time(), data), timeout)
+
+  def Remove(self, key):
+    self._cache.delete(self._Key(key))
+
+
+_default_cache = None
+
+def GetDefaultCache():
+  '''Return the process-wide MemoryCache used by new Api instances.'''
+  global _default_cache
+  if _default_cache is None:
+    _default_cache = MemoryCache()
+  return _default_cache
+
+
 class _FileCacheError(Exception):
   '''Base exception class for FileCache related errors'''
 
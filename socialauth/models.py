@@ -1,7 +1,14 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.db import connection, transaction
+from django.conf import settings
+from django.core.cache import cache
+
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import md5
 
 class AuthMeta(models.Model):
     """Metadata for Authentication"""
@@ -15,10 +22,61 @@ class AuthMeta(models.Model):
     is_email_filled = models.BooleanField(default = False)
     is_profile_modified = models.BooleanField(default = False)
 
+# Seconds an openid_key -> profile resolution is cached across requests; 0 disables
+IDENTITY_CACHE_TIMEOUT = getattr(settings, 'SOCIALAUTH_IDENTITY_CACHE_TIMEOUT', 0)
+
+# OpenidProfile fields kept in the cross-request identity cache
+IDENTITY_FIELDS = ('id', 'openid_key', 'user_id', 'is_username_valid', 'email',
+                   'nickname', 'needs_google_crossdomain_merge')
+
+def identity_cache_key(openid_key):
+    if isinstance(openid_key, unicode):
+        openid_key = openid_key.encode('utf8')
+    return 'socialauth:openid:%s' % md5(openid_key).hexdigest()
+
 class OpenidProfileManager(models.Manager):
-    def needs_google_crossdomain_merge(self, openid_key):
+    def get_for_key(self, openid_key, request=None):
+        """
+        Return the OpenidProfile for openid_key with its user, raising
+        OpenidProfile.DoesNotExist if there is none.
+
+        Lookups are remembered on request, so the backend, openid_done and
+        needs_google_crossdomain_merge share one query. With
+        SOCIALAUTH_IDENTITY_CACHE_TIMEOUT set, the profile is also cached
+        across requests and only the user has to be loaded.
+        """
+        if request is not None:
+            profiles = self._request_profiles(request)
+        else:
+            profiles = {}
+        if openid_key in profiles:
+            return profiles[openid_key]
+        profile = None
+        if IDENTITY_CACHE_TIMEOUT:
+            fields = cache.get(identity_cache_key(openid_key))
+            if fields is not None:
+                profile = self.model(**dict(zip(IDENTITY_FIELDS, fields)))
+        if profile is None:
+            profile = self.select_related('user').get(openid_key=openid_key)
+            if IDENTITY_CACHE_TIMEOUT:
+                cache.set(identity_cache_key(openid_key),
+                          tuple([getattr(profile, f) for f in IDENTITY_FIELDS]),
+                          IDENTITY_CACHE_TIMEOUT)
+        profiles[openid_key] = profile
+        return profile
+
+    def remember(self, request, profile):
+        """Make profile the result of get_for_key for the rest of request."""
+        self._request_profiles(request)[profile.openid_key] = profile
+
+    def _request_profiles(self, request):
+        if not hasattr(request, '_socialauth_openid_profiles'):
+            request._socialauth_openid_profiles = {}
+        return request._socialauth_openid_profiles
+
+    def needs_google_crossdomain_merge(self, openid_key, request=None):
         try:
-            assoc = self.get(openid_key=openid_key)
+            assoc = self.get_for_key(openid_key, request)
         except OpenidProfile.DoesNotExist:
             return False
         else:
@@ -43,6 +101,44 @@ class OpenidProfile(models.Model):
     def __repr__(self):
         return unicode(self.openid_key)
     
+def invalidate_identity_cache(sender, instance, **kwargs):
+    if IDENTITY_CACHE_TIMEOUT:
+        cache.delete(identity_cache_key(instance.openid_key))
+
+post_save.connect(invalidate_identity_cache, sender=OpenidProfile)
+post_delete.connect(invalidate_identity_cache, sender=OpenidProfile)
+
+# Seconds a User is cached for the backends' get_user; 0 disables
+USER_CACHE_TIMEOUT = getattr(settings, 'SOCIALAUTH_USER_CACHE_TIMEOUT', 0)
+
+def user_cache_key(user_id):
+    return 'socialauth:user:%s' % user_id
+
+def get_cached_user(user_id):
+    """
+    Return the User with pk user_id, or None. With SOCIALAUTH_USER_CACHE_TIMEOUT
+    set, the user is kept in the cache so that the auth middleware does not
+    query for it on every request.
+    """
+    if USER_CACHE_TIMEOUT:
+        user = cache.get(user_cache_key(user_id))
+        if user is not None:
+            return user
+    try:
+        user = User.objects.get(pk=user_id)
+    except User.DoesNotExist:
+        return None
+    if USER_CACHE_TIMEOUT:
+        cache.set(user_cache_key(user_id), user, USER_CACHE_TIMEOUT)
+    return user
+
+def invalidate_user_cache(sender, instance, **kwargs):
+    if USER_CACHE_TIMEOUT:
+        cache.delete(user_cache_key(instance.pk))
+
+post_save.connect(invalidate_user_cache, sender=User)
+post_delete.connect(invalidate_user_cache, sender=User)
+
 class LinkedInUserProfile(models.Model):
     """
     For users who login via Linkedin.
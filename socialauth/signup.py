@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""socialauth.signup -- transactional signup shared by the auth backends
+"""
+from django.contrib.auth.models import User
+from django.db import transaction, IntegrityError
+
+from socialauth.models import AuthMeta
+from socialauth.usernames import create_user
+
+
+def create_social_user(profile_model, lookup, provider, prefix, name, user=None,
+                       email=None, user_fields=None, profile_fields=None):
+    """Create the provider profile for lookup, its User and its AuthMeta.
+
+    A User named after prefix and name is created unless user is given. The
+    caller should already have looked for an existing profile; if another
+    request creates the same profile concurrently, the unique constraint on
+    it fails, everything created here is rolled back and the winner's
+    profile is returned instead.
+
+    Values in profile_fields may be functions of the User, called once it
+    exists.
+
+    Returns a (profile, created) tuple. All inserts are committed together.
+    """
+    sid = transaction.savepoint()
+    new_user = user is None
+    try:
+        if new_user:
+            user = create_user(prefix, name, email, **(user_fields or {}))
+        fields = dict(lookup)
+        for name, value in (profile_fields or {}).items():
+            if callable(value):
+                value = value(user)
+            fields[name] = value
+        profile = profile_model(user=user, **fields)
+        profile.save(force_insert=True)
+        AuthMeta(user=user, provider=provider,
+                 provider_model=profile_model.__name__,
+                 provider_id=profile.pk).save(force_insert=True)
+    except IntegrityError:
+        transaction.savepoint_rollback(sid)
+        if new_user and user is not None and user.pk:
+            # Backends without savepoints keep the user; drop it by hand
+            User.objects.filter(pk=user.pk).delete()
+        return profile_model.objects.select_related('user').get(**lookup), False
+    transaction.savepoint_commit(sid)
+    return profile, True
+_create_social_user = create_social_user
+create_social_user = transaction.commit_on_success(create_social_user)
+
+
+def get_or_create_social_user(profile_model, lookup, provider, prefix, name,
+                              user=None, **kwargs):
+    """Return a (profile, created) tuple for lookup, signing up if needed.
+
+    The lookup, user, profile and AuthMeta inserts all happen in a single
+    transaction.
+    """
+    try:
+        return profile_model.objects.select_related('user').get(**lookup), False
+    except profile_model.DoesNotExist:
+        return _create_social_user(profile_model, lookup, provider, prefix, name,
+                                   user=user, **kwargs)
+get_or_create_social_user = transaction.commit_on_success(get_or_create_social_user)
@@ -1,6 +1,33 @@
 from selenium import selenium
 import unittest, time, re
+import cgi
+import logging
+import pickle
+import threading
+import urllib
+import urllib2
+import BaseHTTPServer, SocketServer
+from StringIO import StringIO
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models.query import QuerySet
+from django.core.urlresolvers import reverse
+from django.http import HttpRequest
+from django.utils import simplejson
+from django.test import TestCase
+
+from oauth import oauth
+from openid_consumer.util import AXAttributes, OpenID
+from socialauth import auth_backends, models
+from socialauth.lib import facebook, futures, jsonstream, linkedin, oauth2, oauthtwitter, resilience, transport, twitter
+from socialauth.views import provider_view
+from socialauth.auth_backends import OpenIdBackend, TwitterBackend, LinkedInBackend, FacebookBackend
+from socialauth.models import OpenidProfile, TwitterUserProfile, LinkedInUserProfile, \
+    FacebookUserProfile, AuthMeta
+from socialauth.signup import create_social_user, get_or_create_social_user
+from socialauth.usernames import create_user
 
 from test_data import *
 
@@ -65,6 +92,824 @@ class OpenIdTester(unittest.TestCase):
         self.selenium.stop()
         self.assertEqual([], self.verificationErrors)
 
+class QueryCountMixin(object):
+    def count_queries(self, func, *args, **kwargs):
+        old_debug = settings.DEBUG
+        settings.DEBUG = True
+        connection.queries = []
+        try:
+            result = func(*args, **kwargs)
+            return result, len(connection.queries)
+        finally:
+            settings.DEBUG = old_debug
+
+class IdentityResolutionTest(QueryCountMixin, TestCase):
+    openid_key = 'https://www.google.com/accounts/o8/id?id=abc'
+
+    def setUp(self):
+        self.user = User.objects.create_user('OI-returning', 'me@example.com')
+        OpenidProfile.objects.create(openid_key=self.openid_key, user=self.user,
+                                     email='me@example.com',
+                                     needs_google_crossdomain_merge=True)
+        self.request = HttpRequest()
+
+    def test_returning_user_costs_one_query(self):
+        user, queries = self.count_queries(OpenIdBackend().authenticate,
+                                           self.openid_key, self.request, 'Google')
+        self.assertEqual(user, self.user)
+        self.assertEqual(queries, 1)
+
+    def test_lookups_are_shared_within_a_request(self):
+        OpenIdBackend().authenticate(self.openid_key, self.request, 'Google')
+        profile, queries = self.count_queries(OpenidProfile.objects.get_for_key,
+                                              self.openid_key, self.request)
+        self.assertEqual(profile.user, self.user)
+        merge, more_queries = self.count_queries(
+            OpenidProfile.objects.needs_google_crossdomain_merge,
+            self.openid_key, self.request)
+        self.assertTrue(merge)
+        self.assertEqual(queries + more_queries, 0)
+
+    def test_cross_request_cache_is_invalidated_on_save(self):
+        old_timeout = models.IDENTITY_CACHE_TIMEOUT
+        models.IDENTITY_CACHE_TIMEOUT = 60
+        try:
+            OpenidProfile.objects.get_for_key(self.openid_key)
+            profile, queries = self.count_queries(OpenidProfile.objects.get_for_key,
+                                                  self.openid_key)
+            self.assertEqual(queries, 0)
+            self.assertEqual(profile.user_id, self.user.pk)
+            profile.needs_google_crossdomain_merge = False
+            profile.save()
+            self.assertFalse(OpenidProfile.objects.needs_google_crossdomain_merge(
+                self.openid_key))
+        finally:
+            models.IDENTITY_CACHE_TIMEOUT = old_timeout
+            cache.clear()
+
+class CachedGetUserTest(QueryCountMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('TW-cached', 'me@example.com')
+        self.old_timeout = models.USER_CACHE_TIMEOUT
+        models.USER_CACHE_TIMEOUT = 60
+        cache.delete(models.user_cache_key(self.user.pk))
+
+    def tearDown(self):
+        models.USER_CACHE_TIMEOUT = self.old_timeout
+
+    def test_get_user_is_cached_and_shared(self):
+        self.assertEqual(TwitterBackend().get_user(self.user.pk), self.user)
+        for backend in (OpenIdBackend(), LinkedInBackend(), FacebookBackend()):
+            user, queries = self.count_queries(backend.get_user, self.user.pk)
+            self.assertEqual(user, self.user)
+            self.assertEqual(queries, 0)
+
+    def test_invalidated_on_save_and_delete(self):
+        OpenIdBackend().get_user(self.user.pk)
+        self.user.first_name = 'Bob'
+        self.user.save()
+        self.assertEqual(OpenIdBackend().get_user(self.user.pk).first_name, 'Bob')
+        user_id = self.user.pk
+        self.user.delete()
+        self.assertEqual(OpenIdBackend().get_user(user_id), None)
+
+    def test_disabled_by_default(self):
+        models.USER_CACHE_TIMEOUT = 0
+        OpenIdBackend().get_user(self.user.pk)
+        user, queries = self.count_queries(OpenIdBackend().get_user, self.user.pk)
+        self.assertEqual(queries, 1)
+
+class UsernameAllocationTest(TestCase):
+    def test_uses_plain_name_when_free(self):
+        user = create_user('TW', 'bob', first_name='Bob')
+        self.assertEqual(user.username, 'TW-bob')
+        self.assertEqual(user.email, 'TW-bob@socialauth')
+        self.assertFalse(user.has_usable_password())
+
+    def test_taken_names_get_a_suffix(self):
+        User.objects.create_user('OI-bob', '')
+        user = create_user('OI', 'bob', 'bob@example.com')
+        self.assertTrue(user.username.startswith('OI-bob'))
+        self.assertNotEqual(user.username, 'OI-bob')
+        self.assertEqual(user.email, 'bob@example.com')
+
+    def test_retries_when_insert_races(self):
+        # A concurrent signup claims the name between the lookup and the insert
+        original_exists = QuerySet.exists
+        def exists(queryset):
+            if not User.objects.filter(username='FB-42').count():
+                User.objects.create_user('FB-42', '')
+                return False
+            return original_exists(queryset)
+        QuerySet.exists = exists
+        try:
+            user = create_user('FB', '42')
+        finally:
+            QuerySet.exists = original_exists
+        self.assertNotEqual(user.username, 'FB-42')
+        self.assertEqual(User.objects.filter(username__startswith='FB-42').count(), 2)
+
+    def test_long_names_fit_the_username_column(self):
+        user = create_user('LI', 'x' * 40)
+        self.assertEqual(len(user.username), 30)
+        self.assertTrue(len(create_user('LI', 'x' * 40).username) <= 30)
+
+class SignupTest(TestCase):
+    def test_signup_creates_user_profile_and_authmeta(self):
+        profile, created = get_or_create_social_user(TwitterUserProfile,
+            {'screen_name': 'bob'}, 'Twitter', 'TW', 'bob',
+            user_fields={'first_name': 'Bob'})
+        self.assertTrue(created)
+        self.assertEqual(profile.user.username, 'TW-bob')
+        self.assertEqual(profile.user.first_name, 'Bob')
+        meta = AuthMeta.objects.get(user=profile.user)
+        self.assertEqual((meta.provider, meta.provider_model, meta.provider_id),
+                         ('Twitter', 'TwitterUserProfile', profile.pk))
+
+    def test_returning_user_is_not_recreated(self):
+        first, created = get_or_create_social_user(LinkedInUserProfile,
+            {'linkedin_uid': 'abc'}, 'LinkedIn', 'LI', 'abc')
+        second, created = get_or_create_social_user(LinkedInUserProfile,
+            {'linkedin_uid': 'abc'}, 'LinkedIn', 'LI', 'abc')
+        self.assertFalse(created)
+        self.assertEqual(first.user, second.user)
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_concurrent_signup_rereads_the_winner(self):
+        winner = User.objects.create_user('FB-winner', '')
+        FacebookUserProfile.objects.create(facebook_uid='42', user=winner)
+        profile, created = create_social_user(FacebookUserProfile,
+            {'facebook_uid': '42'}, 'Facebook', 'FB', '42')
+        self.assertFalse(created)
+        self.assertEqual(profile.user, winner)
+        self.assertEqual(User.objects.count(), 1)
+        self.assertEqual(AuthMeta.objects.count(), 0)
+
+    def test_openid_signup(self):
+        request = HttpRequest()
+        request.openid = None
+        user = OpenIdBackend().authenticate('http://bob.example.com/', request, 'Openid')
+        profile = OpenidProfile.objects.get(openid_key='http://bob.example.com/')
+        self.assertEqual(profile.user, user)
+        self.assertTrue(user.username.startswith('OI-'))
+        self.assertFalse(profile.is_username_valid)
+        self.assertEqual(profile.email, '%s@socialauth' % user.username)
+        self.assertEqual(profile.email, user.email)
+        self.assertEqual(AuthMeta.objects.get(user=user).provider_model, 'OpenidProfile')
+
+    def test_openid_placeholder_email_follows_the_username(self):
+        create_user('OI', 'bob')
+        request = HttpRequest()
+        request.openid = OpenID('http://bob.example.com/', time.time(), sreg={'nickname': 'bob'})
+        user = OpenIdBackend().authenticate('http://bob.example.com/', request, 'Openid')
+        self.assertNotEqual(user.username, 'OI-bob')
+        self.assertEqual(OpenidProfile.objects.get(user=user).email, user.email)
+
+class AuthEventLogTest(TestCase):
+    def setUp(self):
+        self.records = []
+        test = self
+        class Collect(logging.Handler):
+            def emit(self, record):
+                test.records.append(record)
+        self.handler = Collect()
+        self.logger = logging.getLogger('socialauth.auth_backends')
+        self.old_level = self.logger.level
+        self.logger.addHandler(self.handler)
+        self.logger.setLevel(logging.INFO)
+        self.old_rate = auth_backends.AUTH_LOG_SAMPLE_RATE
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.logger.setLevel(self.old_level)
+        auth_backends.AUTH_LOG_SAMPLE_RATE = self.old_rate
+
+    def authenticate(self):
+        request = HttpRequest()
+        request.openid = OpenID('http://bob.example.com/', time.time(), ax=AXAttributes(
+            {'http://axschema.org/contact/email': ['bob@example.com']}))
+        return OpenIdBackend().authenticate('http://bob.example.com/', request, 'Openid')
+
+    def test_single_redacted_event(self):
+        user = self.authenticate()
+        self.assertEqual(len(self.records), 1)
+        event = self.records[0].auth_event
+        self.assertEqual(event['outcome'], 'created')
+        self.assertEqual(event['user_id'], user.pk)
+        self.assertTrue(event['email'].startswith('sha1:'))
+        self.assertFalse('bob@example.com' in self.records[0].getMessage())
+        self.authenticate()
+        self.assertEqual(self.records[1].auth_event['outcome'], 'existing')
+        self.assertEqual(self.records[1].auth_event['email'], event['email'])
+
+    def test_disabled(self):
+        auth_backends.AUTH_LOG_SAMPLE_RATE = 0
+        self.authenticate()
+        auth_backends.AUTH_LOG_SAMPLE_RATE = 1
+        self.logger.setLevel(logging.WARNING)
+        self.authenticate()
+        self.assertEqual(self.records, [])
+
+class KeepAliveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.hits += 1
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path == '/slow-body':
+            # Headers at once, then a byte every 0.1s
+            self.send_response(200)
+            self.send_header('Content-Length', '10')
+            self.end_headers()
+            for i in range(10):
+                self.wfile.write('x')
+                time.sleep(0.1)
+            return
+        if self.path == '/hangup' and self.server.hangups_left:
+            # Close the connection without answering
+            self.server.hangups_left -= 1
+            self.close_connection = True
+            return
+        status = self.path == '/missing' and 404 or 200
+        path = self.path.split('?', 1)[0]
+        if path == '/fail' or (path == '/flaky' and self.server.failures_left):
+            self.server.failures_left -= 1
+            status = 500
+        elif self.path == '/slow':
+            time.sleep(1)
+        body = 'path=%s' % self.path
+        if self.path.startswith('/method'):
+            body = self.command
+        elif 'access_token=' in self.path:
+            body = simplejson.dumps({'id': '42'})
+        location = None
+        if self.path.startswith('/redirect'):
+            query = cgi.parse_qs(self.path.split('?', 1)[1])
+            status, location = int(query['code'][0]), query['to'][0]
+        elif self.path == '/loop':
+            status, location = 302, '/loop'
+        self.send_response(status)
+        if location:
+            self.send_header('Location', location)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        # Simulate a server dropping an idle keep-alive connection
+        self.close_connection = self.path == '/drop'
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+class ThreadedHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    hits = 0
+    failures_left = 0
+    hangups_left = 0
+
+    def handle_error(self, request, client_address):
+        # Clients that gave up on /slow close the socket under the handler
+        pass
+
+class LocalProviderMixin(object):
+    """Runs a keep-alive HTTP server on localhost standing in for a provider."""
+    def setUp(self):
+        self.server = ThreadedHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        threading.Thread(target=self.server.serve_forever).start()
+        self.base = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.transport = transport.Transport()
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+class TransportTest(LocalProviderMixin, TestCase):
+    def pool(self):
+        return self.transport.get_pool('http', '127.0.0.1', self.server.server_address[1])
+
+    def test_connections_are_reused(self):
+        for i in range(3):
+            response = self.transport.urlopen(self.base + '/a?i=%d' % i)
+            self.assertEqual(response.read(), 'path=/a?i=%d' % i)
+        self.assertEqual(self.pool().created, 1)
+
+    def test_http_errors(self):
+        self.assertRaises(urllib2.HTTPError, self.transport.urlopen, self.base + '/missing')
+        self.assertEqual(self.transport.request('GET', self.base + '/missing').status, 404)
+        self.assertEqual(self.pool().created, 1)
+
+    def test_reads_do_not_reset_the_socket_timeout(self):
+        calls = []
+        settimeout = transport._DeadlineSocket.settimeout
+        def counting_settimeout(sock, timeout):
+            calls.append(timeout)
+            settimeout(sock, timeout)
+        transport._DeadlineSocket.settimeout = counting_settimeout
+        try:
+            self.transport.urlopen(self.base + '/a').read()
+            previous = transport.set_deadline(time.time() + 5)
+            try:
+                self.transport.urlopen(self.base + '/b').read()
+            finally:
+                transport.set_deadline(previous)
+        finally:
+            transport._DeadlineSocket.settimeout = settimeout
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[0], self.transport.read_timeout)
+        self.assertTrue(calls[1] <= 5)
+
+    def test_dropped_connection_is_replaced(self):
+        self.transport.urlopen(self.base + '/drop')
+        self.assertEqual(self.transport.urlopen(self.base + '/b').read(), 'path=/b')
+        self.assertEqual(self.pool().created, 2)
+
+    def test_opener(self):
+        opener = transport.Opener([('User-Agent', 'test')], self.transport)
+        self.assertEqual(opener.open(self.base + '/c', 'x=1').read(), 'path=/c')
+
+    def test_requests_are_resent_only_when_safe(self):
+        self.transport.urlopen(self.base + '/a')
+        self.server.hangups_left = 1
+        self.assertEqual(self.transport.urlopen(self.base + '/hangup').read(), 'path=/hangup')
+        hits = self.server.hits
+        self.server.hangups_left = 1
+        self.assertRaises(transport.STALE_CONNECTION_ERRORS, self.transport.urlopen,
+                          self.base + '/hangup', 'x=1')
+        self.assertEqual(self.server.hits, hits + 1)
+
+    def redirect(self, to, code=302):
+        return self.base + '/redirect?' + urllib.urlencode({'to': to, 'code': code})
+
+    def test_redirects_are_followed(self):
+        self.assertEqual(self.transport.urlopen(self.redirect('/a')).read(), 'path=/a')
+        self.assertEqual(self.transport.urlopen(self.redirect(self.base + '/b', 301)).read(), 'path=/b')
+        self.assertEqual(self.transport.urlopen(self.redirect('/method', 303), 'x=1').read(), 'GET')
+        self.assertEqual(self.transport.urlopen(self.redirect('/method', 307), 'x=1').read(), 'POST')
+        self.assertEqual(self.transport.request('GET', self.redirect('/a')).status, 302)
+        # A redirect loop, and a 3xx that is not a redirect, are errors
+        self.assertRaises(urllib2.HTTPError, self.transport.urlopen, self.base + '/loop')
+        self.assertRaises(urllib2.HTTPError, self.transport.urlopen, self.redirect('/a', 300))
+        self.assertEqual(self.pool().created, 1)
+
+    def test_environment_proxy(self):
+        proxied = transport.Transport(proxies={'http': self.base})
+        response = proxied.urlopen('http://provider.example.com/c?d=1')
+        self.assertEqual(response.read(), 'path=http://provider.example.com/c?d=1')
+        self.assertEqual(proxied.request('GET', 'http://provider.example.com/missing').status, 200)
+        self.assertEqual(proxied._pools, {})
+
+    def test_streaming_responses(self):
+        for i in range(2):
+            response = self.transport.urlopen(self.base + '/stream', stream=True)
+            self.assertEqual(''.join(iter(lambda: response.read(3), '')), 'path=/stream')
+        self.assertEqual(self.pool().created, 1)
+        # Closed before the end, the connection cannot be reused
+        self.transport.request('GET', self.base + '/stream', stream=True).close()
+        self.transport.urlopen(self.base + '/stream')
+        self.assertEqual(self.pool().created, 2)
+        self.assertRaises(urllib2.HTTPError, self.transport.urlopen,
+                          self.base + '/missing', stream=True)
+        self.assertEqual(self.pool().created, 2)
+
+    def test_connections_per_host_are_bounded(self):
+        pool = transport.ConnectionPool('http', '127.0.0.1', self.server.server_address[1],
+                                        connect_timeout=0.1, max_connections=1)
+        conn, reused = pool.get()
+        self.assertRaises(transport.PoolTimeout, pool.get)
+        pool.put(conn)
+        self.assertEqual(pool.get(), (conn, True))
+
+    def test_shared_linkedin_client(self):
+        client = linkedin.get_linkedin('key', 'secret')
+        self.assertTrue(linkedin.get_linkedin('key', 'secret') is client)
+        self.assertTrue(client.transport is transport.get_transport())
+
+class ProviderFutureTest(LocalProviderMixin, TestCase):
+    def test_errors_are_raised_by_result(self):
+        future = futures.submit(transport.urlopen, self.base + '/missing')
+        self.assertRaises(urllib2.HTTPError, future.result, 5)
+        self.assertTrue(future.done())
+        called = []
+        future.add_done_callback(called.append)
+        self.assertEqual(called, [future])
+
+    def test_failing_callbacks_do_not_kill_workers(self):
+        executor = futures.Executor(workers=1)
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        futures.logger.addHandler(handler)
+        try:
+            release = threading.Event()
+            future = executor.submit(release.wait, 5)
+            future.add_done_callback(lambda f: 1 / 0)
+            release.set()
+            self.assertEqual(executor.submit(lambda: 'ok').result(timeout=5), 'ok')
+            future.add_done_callback(lambda f: 1 / 0)
+        finally:
+            futures.logger.removeHandler(handler)
+        self.assertEqual(len(records), 2)
+        self.assertTrue(executor._threads[0].isAlive())
+
+class ResilienceTest(LocalProviderMixin, TestCase):
+    def setUp(self):
+        super(ResilienceTest, self).setUp()
+        self.old_policies = resilience.POLICIES
+        resilience.POLICIES = {'stub': {'deadline': 0.5, 'retries': 2, 'backoff': 0.01,
+                                        'failure_threshold': 2, 'reset_timeout': 0.2}}
+        resilience._breakers.clear()
+
+    def tearDown(self):
+        resilience.POLICIES = self.old_policies
+        resilience._breakers.clear()
+        super(ResilienceTest, self).tearDown()
+
+    def call(self, path, **kwargs):
+        return resilience.call('stub', self.transport.urlopen, self.base + path, **kwargs)
+
+    def test_idempotent_calls_are_retried(self):
+        self.server.failures_left = 2
+        self.assertEqual(self.call('/flaky', idempotent=True).read(), 'path=/flaky')
+        self.assertEqual(self.server.hits, 3)
+
+    def test_other_calls_are_not_retried(self):
+        self.server.failures_left = 1
+        self.assertRaises(resilience.ProviderUnavailable, self.call, '/flaky')
+        self.assertEqual(self.server.hits, 1)
+
+    def test_deadline(self):
+        start = time.time()
+        self.assertRaises(resilience.ProviderUnavailable, self.call, '/slow', idempotent=True)
+        self.assertTrue(time.time() - start < 0.9)
+        self.assertEqual(transport.set_deadline(None), None)
+
+    def test_deadline_covers_slow_bodies(self):
+        start = time.time()
+        self.assertRaises(resilience.ProviderUnavailable, self.call, '/slow-body')
+        self.assertTrue(time.time() - start < 0.9)
+
+    def test_linkedin_server_errors_are_provider_failures(self):
+        client = linkedin.LinkedIn('key', 'secret', transport=self.transport)
+        token = oauth.OAuthToken('token', 'secret')
+        self.server.failures_left = 2
+        self.assertEqual(resilience.call('stub', client.profile_api.doApiRequest,
+                                         self.base + '/flaky', token, idempotent=True),
+                         'path=/flaky')
+        self.assertEqual(self.server.hits, 3)
+        for i in range(2):
+            self.assertRaises(resilience.ProviderUnavailable, resilience.call, 'stub',
+                              client.profile_api.doApiRequest, self.base + '/fail', token)
+        self.assertEqual(resilience.get_breaker('stub').state, 'open')
+
+    def test_facebook_graph_calls_go_through_the_transport(self):
+        graph_url, facebook.GRAPH_URL = facebook.GRAPH_URL, self.base
+        try:
+            self.assertEqual(facebook.get_graph_object('token'), {'id': '42'})
+            self.server.failures_left = 2
+            self.assertEqual(resilience.call('stub', facebook.get_graph_object, 'token',
+                                             'flaky', idempotent=True), {'id': '42'})
+            self.assertEqual(self.server.hits, 4)
+            for i in range(2):
+                self.assertRaises(resilience.ProviderUnavailable, resilience.call, 'stub',
+                                  facebook.get_graph_object, 'token', 'fail')
+            self.assertEqual(resilience.get_breaker('stub').state, 'open')
+        finally:
+            facebook.GRAPH_URL = graph_url
+
+    def test_client_errors_are_not_provider_failures(self):
+        for i in range(3):
+            self.assertRaises(urllib2.HTTPError, self.call, '/missing')
+        self.assertEqual(resilience.get_breaker('stub').state, 'closed')
+
+    def test_circuit_breaker(self):
+        for i in range(2):
+            self.assertRaises(resilience.ProviderUnavailable, self.call, '/fail')
+        hits = self.server.hits
+        self.assertRaises(resilience.ProviderUnavailable, self.call, '/a')
+        self.assertEqual(self.server.hits, hits)
+        time.sleep(0.2)
+        self.assertEqual(self.call('/a').read(), 'path=/a')
+        self.assertEqual(resilience.get_breaker('stub').state, 'closed')
+
+    def test_views_redirect_to_login_page(self):
+        def view(request):
+            return self.call('/fail')
+        response = provider_view(view)(HttpRequest())
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].endswith(reverse('socialauth_login_page')))
+
+class OAuthSigningTest(unittest.TestCase):
+    def setUp(self):
+        # The example from appendix A.5 of the OAuth Core 1.0 specification
+        self.consumer = oauth2.OAuthConsumer('dpf43f3p2l4k3l03', 'kd94hf93k423kf44')
+        self.token = oauth2.OAuthToken('nnch734d00sl2jdk', 'pfkkdhi9sl3r4s00')
+        self.request = oauth2.OAuthRequest('GET', 'http://photos.example.net:80/photos', {
+            'file': 'vacation.jpg', 'size': 'original',
+            'oauth_consumer_key': 'dpf43f3p2l4k3l03', 'oauth_token': 'nnch734d00sl2jdk',
+            'oauth_signature_method': 'HMAC-SHA1', 'oauth_timestamp': '1191242096',
+            'oauth_nonce': 'kllo9940pd9333jh', 'oauth_version': '1.0'})
+
+    def test_hmac_sha1(self):
+        method = oauth2.OAuthSignatureMethod_HMAC_SHA1()
+        self.request.sign_request(method, self.consumer, self.token)
+        self.assertEqual(self.request.get_parameter('oauth_signature'),
+                         'tR3+Ty81lMeYAr/Fid0kMTYa/WM=')
+        # Re-signing ignores the signature already in the parameters
+        self.assertEqual(self.request.build_signature(method, self.consumer, self.token),
+                         'tR3+Ty81lMeYAr/Fid0kMTYa/WM=')
+
+    def test_secret_change_is_picked_up(self):
+        self.assertEqual(oauth2.signing_key(self.consumer, self.token),
+                         'kd94hf93k423kf44&pfkkdhi9sl3r4s00')
+        self.token.secret = 'a b'
+        self.assertEqual(oauth2.signing_key(self.consumer, self.token), 'kd94hf93k423kf44&a%20b')
+        self.assertEqual(oauth2.signing_key(self.consumer, None), 'kd94hf93k423kf44&')
+
+    def test_batch_signer(self):
+        method = oauth2.OAuthSignatureMethod_HMAC_SHA1()
+        other = oauth2.OAuthToken('other', 'other&secret')
+        signer = oauth2.BatchSigner(self.consumer)
+        batch = [('http://photos.example.net/photos', 'GET', {'size': 'original'}, self.token),
+                 ('https://api.example.com:443/update', 'post', {'status': u'caf\xe9'}, other),
+                 ('http://photos.example.net/photos', 'GET', None, None)]
+        signed = signer.sign(batch)
+        for request, (url, http_method, params, token) in zip(signed, batch):
+            self.assertEqual(request.get_parameter('oauth_consumer_key'), 'dpf43f3p2l4k3l03')
+            self.assertEqual(request.build_signature(method, self.consumer, token),
+                             request.get_parameter('oauth_signature'))
+        self.assertEqual(signed[1].get_parameter('oauth_token'), 'other')
+        headers = signer.sign_headers(batch[:1], realm='photos')
+        self.assertTrue(headers[0]['Authorization'].startswith('OAuth realm="photos", '))
+
+    def test_nonces(self):
+        nonces = set([oauth2.generate_nonce() for i in range(10000)])
+        self.assertEqual(len(nonces), 10000)
+        for nonce in nonces:
+            self.assertEqual(len(nonce), oauth2.NONCE_LENGTH)
+            self.assertEqual(oauth2.escape(nonce), nonce)
+        self.assertEqual(len(oauth2.generate_nonce(8)), 8)
+
+    def test_entropy_is_not_shared_after_fork(self):
+        pool = oauth2._EntropyPool(64)
+        first = pool.read(8)
+        pool._pid = -1 # As if this were a forked child
+        pool._offset = 0
+        self.assertNotEqual(pool.read(8), first)
+
+class FakeUrllib(object):
+    """Stands in for urllib2 in twitter.Api, counting the fetches."""
+    def __init__(self, body='{"screen_name": "bob", "id": 1}'):
+        self.body = body
+        self.fetches = []
+
+    def build_opener(self, *handlers):
+        return self
+
+    def open(self, url, data=None):
+        self.fetches.append(url)
+        return StringIO(self.body)
+
+    def close(self):
+        pass
+
+class TwitterCacheTest(TestCase):
+    def test_memory_cache_is_bounded(self):
+        cache = twitter.MemoryCache(max_bytes=10)
+        cache.Set('a', '1234')
+        cache.Set('b', '5678')
+        cache.Get('a')
+        cache.Set('c', '901')
+        self.assertEqual((cache.Get('a'), cache.Get('b'), cache.Get('c')), ('1234', None, '901'))
+        self.assertEqual(cache.GetFresh('a', 60), '1234')
+        self.assertEqual(cache.GetFresh('a', 0), None)
+        cache.Set('d', '12345678901')
+        self.assertEqual((cache.Get('a'), cache.Get('d')), ('1234', None))
+        self.assertEqual(cache._bytes, 7)
+
+    def test_default_timeout_follows_the_api(self):
+        self.assertEqual(twitter.MemoryCache()._timeout, twitter.Api.DEFAULT_CACHE_TIMEOUT)
+        api = twitter.Api()
+        cache, urllib = twitter.MemoryCache(timeout=3600), FakeUrllib()
+        api.SetCache(cache)
+        api.SetUrllib(urllib)
+        api.SetCacheTimeout(0.01)
+        api.GetUser('bob')
+        time.sleep(0.02)
+        self.assertEqual([key for key in cache._data.keys() if cache.Get(key)], [])
+
+    def test_memory_cache_expires(self):
+        cache = twitter.MemoryCache(timeout=0)
+        cache.Set('a', '1')
+        self.assertEqual(cache.Get('a'), None)
+
+    def test_django_cache(self):
+        cache = twitter.DjangoCache(prefix='twitter-test')
+        cache.Set(u'http://twitter.com/users/show/bob.json', 'data')
+        self.assertEqual(cache.GetFresh(u'http://twitter.com/users/show/bob.json', 60), 'data')
+        self.assertTrue(cache.GetCachedTime(u'http://twitter.com/users/show/bob.json') <= time.time())
+        cache.Remove(u'http://twitter.com/users/show/bob.json')
+        self.assertEqual(cache.Get(u'http://twitter.com/users/show/bob.json'), None)
+
+    def test_api_reads_through_the_cache(self):
+        api = twitter.Api()
+        self.assertTrue(api._cache is twitter.GetDefaultCache())
+        api.SetCache(twitter.MemoryCache())
+        urllib = FakeUrllib()
+        api.SetUrllib(urllib)
+        for i in range(3):
+            self.assertEqual(api.GetUser('bob').screen_name, 'bob')
+        self.assertEqual(len(urllib.fetches), 1)
+
+    def oauth_api(self, token_key, cache, urllib):
+        api = oauthtwitter.OAuthApi('key', 'secret', oauth.OAuthToken(token_key, 'secret'))
+        api.SetCache(cache)
+        api.SetUrllib(urllib)
+        return api
+
+    def test_oauth_gets_are_cached_per_token(self):
+        cache, urllib = twitter.MemoryCache(), FakeUrllib()
+        for i in range(3):
+            self.assertEqual(self.oauth_api('alice', cache, urllib).GetUserInfo().screen_name, 'bob')
+        self.assertEqual(len(urllib.fetches), 1)
+        self.assertTrue('oauth_nonce=' in urllib.fetches[0])
+        self.oauth_api('bob', cache, urllib).GetUserInfo()
+        self.assertEqual(len(urllib.fetches), 2)
+        api = self.oauth_api('alice', cache, urllib)
+        self.assertEqual(api._GetCacheKey('http://twitter.com/a.json?x=1', {'oauth_nonce': '1', 'count': 2}),
+                         'alice:http://twitter.com/a.json?count=2&x=1')
+
+    def test_endpoint_cache_timeouts(self):
+        cache, urllib = twitter.MemoryCache(), FakeUrllib()
+        for i in range(2):
+            api = self.oauth_api('alice', cache, urllib)
+            api.SetEndpointCacheTimeout('https://twitter.com/account/verify_credentials.json', 0)
+            api.GetUserInfo()
+        self.assertEqual(len(urllib.fetches), 2)
+
+    def test_large_lists_stream_past_the_cache(self):
+        cache, urllib = twitter.MemoryCache(), FakeUrllib('[{"id": 1}, {"id": 2}]  ')
+        api = twitter.Api()
+        api.SetCache(cache)
+        api.SetUrllib(urllib)
+        for i in range(2):
+            self.assertEqual([s.id for s in api.GetPublicTimeline()], [1, 2])
+        self.assertEqual(len(urllib.fetches), 1)
+        api.MAX_CACHED_STREAM = 10
+        api.SetUrllib(FakeUrllib('[{"id": 3}, {"id": 4}]'))
+        self.assertEqual([s.id for s in api.GetUserTimeline('bob')], [3, 4])
+        self.assertEqual([key for key in cache._data.keys() if 'bob' in key], [])
+
+    def test_oauth_lists_stream_through_the_cache(self):
+        cache, urllib = twitter.MemoryCache(), FakeUrllib('[{"id": 1}]')
+        for i in range(2):
+            api = self.oauth_api('alice', cache, urllib)
+            self.assertEqual([s.id for s in api.GetFriendsTimeline()], [1])
+        self.assertEqual(len(urllib.fetches), 1)
+
+class TwitterModelTest(TestCase):
+    status = {'id': 10, 'text': 'hi', 'created_at': 'Sat Jan 27 04:17:38 +0000 2007',
+              'favorited': False, 'truncated': False, 'source': 'web',
+              'user': {'id': 1, 'screen_name': 'bob', 'followers_count': 3,
+                       'status': {'id': 9, 'text': 'earlier'}}}
+
+    def test_hydration_matches_the_constructors(self):
+        status = twitter.Status.NewFromJsonDict(self.status)
+        expected = twitter.Status(id=10, text='hi', created_at='Sat Jan 27 04:17:38 +0000 2007',
+                                  favorited=False, truncated=False, source='web',
+                                  user=twitter.User(id=1, screen_name='bob', followers_count=3,
+                                                    status=twitter.Status(id=9, text='earlier')))
+        self.assertEqual(status, expected)
+        self.assertEqual(status.AsDict(), self.status)
+        self.assertEqual(status.user.status.user, None)
+        self.assertEqual(status.in_reply_to_status_id, None)
+        self.assertTrue(status.now <= time.time())
+        message = twitter.DirectMessage.NewFromJsonDict({'id': 5, 'text': 'psst'})
+        self.assertEqual(message, twitter.DirectMessage(id=5, text='psst'))
+
+    def test_models_have_no_instance_dict(self):
+        for model in (twitter.Status(), twitter.User(), twitter.DirectMessage()):
+            self.assertFalse(hasattr(model, '__dict__'))
+            self.assertRaises(AttributeError, setattr, model, 'unknown', 1)
+
+    def test_models_pickle_with_every_protocol(self):
+        status = twitter.Status.NewFromJsonDict(self.status)
+        message = twitter.DirectMessage(id=5, text='psst')
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copy = pickle.loads(pickle.dumps(status, protocol))
+            self.assertEqual(copy, status)
+            self.assertEqual(copy._now, status._now)
+            self.assertEqual(copy.user.status.text, 'earlier')
+            self.assertEqual(pickle.loads(pickle.dumps(message, protocol)), message)
+            self.assertEqual(pickle.loads(pickle.dumps(twitter.User(), protocol)), twitter.User())
+
+    def test_bulk_hydration(self):
+        items = [dict(self.status, id=i) for i in range(50)] + [{'id': 50}]
+        statuses = twitter.Status.NewListFromJsonList(items)
+        self.assertEqual([s.id for s in statuses], range(51))
+        self.assertEqual([s.user and s.user.screen_name for s in statuses], ['bob'] * 50 + [None])
+        self.assertEqual(statuses[0].user.status.text, 'earlier')
+        self.assertEqual(twitter.Status.NewListFromJsonList([]), [])
+
+    def test_api_lists_use_the_hydrator(self):
+        api = twitter.Api()
+        api.SetCache(None)
+        api.SetUrllib(FakeUrllib('[{"id": 1, "user": {"screen_name": "alice"}}, {"id": 2}]'))
+        statuses = api.GetPublicTimeline()
+        self.assertEqual([s.id for s in statuses], [1, 2])
+        self.assertEqual(statuses[0].user.screen_name, 'alice')
+
+class PagedUrllib(FakeUrllib):
+    """Serves numbered pages of JSON lists, then an empty one."""
+    def __init__(self, pages):
+        FakeUrllib.__init__(self)
+        self.pages = pages
+
+    class HTTPBasicAuthHandler(object):
+        def add_password(self, *args):
+            pass
+
+    def open(self, url, data=None):
+        self.fetches.append(url)
+        page = int(re.search(r'page=(\d+)', url).group(1))
+        return StringIO(page <= len(self.pages) and self.pages[page - 1] or '[]')
+
+class TwitterPaginationTest(TestCase):
+    def api(self, urllib):
+        api = twitter.Api(username='bob', password='secret')
+        api.SetCache(None)
+        api.SetUrllib(urllib)
+        return api
+
+    def test_pages_are_fetched_lazily(self):
+        urllib = PagedUrllib(['[{"id": 1}, {"id": 2}]', '[{"id": 3}]'])
+        followers = self.api(urllib).IterFollowers()
+        self.assertEqual(urllib.fetches, [])
+        self.assertEqual(followers.next().id, 1)
+        self.assertEqual(len(urllib.fetches), 1)
+        self.assertEqual([user.id for user in followers], [2, 3])
+        self.assertEqual(len(urllib.fetches), 3)
+
+    def test_prefetch(self):
+        urllib = PagedUrllib(['[{"id": %d}]' % i for i in range(1, 6)])
+        messages = self.api(urllib).IterDirectMessages(since_id=7, prefetch=True)
+        self.assertEqual(messages.next().id, 1)
+        for i in range(50):
+            if len(urllib.fetches) == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(urllib.fetches), 2)
+        self.assertEqual([message.id for message in messages], [2, 3, 4, 5])
+        self.assertTrue(all(['since_id=7' in url for url in urllib.fetches]))
+
+    def test_iterators(self):
+        urllib = PagedUrllib(['[{"id": 1}]'])
+        api = self.api(urllib)
+        self.assertEqual([s.id for s in api.IterUserTimeline('alice', count=50)], [1])
+        self.assertTrue('user_timeline/alice.json' in urllib.fetches[0])
+        self.assertTrue('count=50' in urllib.fetches[0])
+        self.assertEqual([s.id for s in api.IterReplies()], [1])
+        self.assertEqual([u.id for u in api.IterFriends('alice', prefetch=True)], [1])
+
+    def test_errors_are_raised_while_iterating(self):
+        urllib = PagedUrllib(['[{"id": 1}]', '{"error": "Rate limit exceeded"}'])
+        friends = self.api(urllib).IterFriends(prefetch=True)
+        self.assertEqual(friends.next().id, 1)
+        self.assertRaises(twitter.TwitterError, friends.next)
+
+class JsonStreamTest(unittest.TestCase):
+    document = [{'id': 1, 'text': u'caf\xe9 \u2603', 'nested': [1, 2.5, None, True]},
+                12345678901234567890, 'x' * 100, [], {}, -0.5e10]
+
+    def decode(self, body, chunk_size):
+        return list(jsonstream.iter_array(StringIO(body), chunk_size=chunk_size))
+
+    def test_items_match_the_document(self):
+        for body in (simplejson.dumps(self.document),
+                     simplejson.dumps(self.document, indent=4)):
+            for chunk_size in (1, 2, 7, 64, 100000):
+                self.assertEqual(self.decode(body, chunk_size), self.document)
+        self.assertEqual(self.decode(' [ ] ', 1), [])
+
+    def test_errors(self):
+        try:
+            self.decode('{"error": "Not found"}', 4)
+        except jsonstream.NotAnArray, e:
+            self.assertEqual(e.value, {'error': 'Not found'})
+        else:
+            self.fail('NotAnArray not raised')
+        for body in ('', '[1, 2', '[1 2]', '[{"a": }]'):
+            self.assertRaises(ValueError, self.decode, body, 3)
+
+    def test_api_decodes_incrementally(self):
+        api = twitter.Api()
+        api.SetCache(None)
+        api.SetUrllib(FakeUrllib(simplejson.dumps([{'id': i, 'user': {'id': i}} for i in range(250)])))
+        statuses = api.GetPublicTimeline()
+        self.assertEqual([(s.id, s.user.id) for s in statuses], [(i, i) for i in range(250)])
+        api.SetUrllib(FakeUrllib('{"error": "Rate limit exceeded"}'))
+        self.assertRaises(twitter.TwitterError, api.GetPublicTimeline)
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""socialauth.usernames -- collision-free usernames for new social users
+"""
+import random
+
+from django.contrib.auth.models import User
+from django.db import transaction, IntegrityError
+
+USERNAME_MAX_LENGTH = User._meta.get_field('username').max_length
+
+# Attempts before giving up; each one after the first widens the random suffix
+MAX_ATTEMPTS = 8
+
+
+class UsernameAllocationError(Exception):
+    pass
+
+
+def candidates(prefix, name):
+    """Yield usernames to try for prefix and name, e.g. TW-bob, TW-bob42, ...
+
+    The first candidate is the plain name, the rest carry a random numeric
+    suffix, so the expected number of tries does not grow with the number of
+    users sharing the name.
+    """
+    base = u'%s-%s' % (prefix, name)
+    yield base[:USERNAME_MAX_LENGTH]
+    for attempt in range(1, MAX_ATTEMPTS):
+        suffix = unicode(random.randint(2, 10 ** (attempt + 1)))
+        yield base[:USERNAME_MAX_LENGTH - len(suffix)] + suffix
+
+
+def create_user(prefix, name, email=None, **fields):
+    """Create a User with an unusable password and a free username.
+
+    The username is '<prefix>-<name>', suffixed if it is taken. Uniqueness is
+    guaranteed by the database: a candidate that another signup claims between
+    the lookup and the insert raises IntegrityError and the next one is tried.
+    If email is None, '<username>@socialauth' is used as a placeholder.
+    """
+    for username in candidates(prefix, name):
+        if User.objects.filter(username=username).exists():
+            continue
+        user = User(username=username, **fields)
+        user.email = email is None and '%s@socialauth' % username or email
+        user.set_unusable_password()
+        sid = transaction.savepoint()
+        try:
+            user.save(force_insert=True)
+        except IntegrityError:
+            transaction.savepoint_rollback(sid)
+            continue
+        transaction.savepoint_commit(sid)
+        return user
+    raise UsernameAllocationError('No free username for %s-%s' % (prefix, name))
@@ -13,6 +13,7 @@ from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.views import logout
 from django.utils.translation import ugettext as _
+from django.utils.functional import wraps
 try:
     import json #Works with Python 2.6
 except ImportError:
@@ -33,6 +34,7 @@ from socialauth.lib import oauthgoogle
 from socialauth.lib.facebook import get_user_info, get_facebook_signature, \
                             get_friends, get_friends_via_fql
 from socialauth.lib.linkedin import *
+from socialauth.lib.resilience import ProviderUnavailable, call as call_provider
 from socialauth.auth_backends import OpenIdBackend
 from socialauth import signals
 
@@ -56,13 +58,27 @@ def restore_session(request, session):
             request.session[key] = value
     return request
 
+def provider_view(view):
+    """Send the user back to the login page when the provider is unavailable."""
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ProviderUnavailable, e:
+            logger.warning('%s: %s', view.__name__, e)
+            return HttpResponseRedirect(reverse('socialauth_login_page'))
+    return wraps(view)(wrapper)
+
+@provider_view
 def linkedin_login(request):
-    linkedin = LinkedIn(settings.LINKEDIN_CONSUMER_KEY, settings.LINKEDIN_CONSUMER_SECRET)
-    request_token = linkedin.getRequestToken(callback = request.build_absolute_uri(reverse('socialauth_linkedin_login_done')))
+    linkedin = get_linkedin(settings.LINKEDIN_CONSUMER_KEY, settings.LINKEDIN_CONSUMER_SECRET)
+    request_token = call_provider('linkedin', linkedin.getRequestToken,
+        callback = request.build_absolute_uri(reverse('socialauth_linkedin_login_done')),
+        idempotent=True)
     request.session['linkedin_request_token'] = request_token
     signin_url = linkedin.getAuthorizeUrl(request_token)
     return HttpResponseRedirect(signin_url)
 
+@provider_view
 def linkedin_login_done(request):
     request_token = request.session.get('linkedin_request_token', None)
 
@@ -72,9 +88,9 @@ def linkedin_login_done(request):
         # Send them to the login page
         return HttpResponseRedirect(reverse("socialauth_login_page"))
 
-    linkedin = LinkedIn(settings.LINKEDIN_CONSUMER_KEY, settings.LINKEDIN_CONSUMER_SECRET)
+    linkedin = get_linkedin(settings.LINKEDIN_CONSUMER_KEY, settings.LINKEDIN_CONSUMER_SECRET)
     verifier = request.GET.get('oauth_verifier', None)
-    access_token = linkedin.getAccessToken(request_token,verifier)
+    access_token = call_provider('linkedin', linkedin.getAccessToken, request_token, verifier)
     
     request.session['access_token'] = access_token
     if request.user and request.user.is_authenticated():
@@ -103,13 +119,17 @@ def linkedin_login_done(request):
         # authentication was successful, use is now logged in
         return HttpResponseRedirect(settings.LOGIN_REDIRECT_URL)
 
+@provider_view
 def twitter_login(request):
     twitter = oauthtwitter.TwitterOAuthClient(settings.TWITTER_CONSUMER_KEY, settings.TWITTER_CONSUMER_SECRET)
-    request_token = twitter.fetch_request_token(callback = request.build_absolute_uri(reverse('socialauth_twitter_login_done')))  
+    request_token = call_provider('twitter', twitter.fetch_request_token,
+        callback = request.build_absolute_uri(reverse('socialauth_twitter_login_done')),
+        idempotent=True)
     request.session['request_token'] = request_token.to_string()
     signin_url = twitter.authorize_token_url(request_token)
     return HttpResponseRedirect(signin_url)
 
+@provider_view
 def twitter_login_done(request):
     request_token = request.session.get('request_token', None)
     verifier = request.GET.get('oauth_verifier', None)
@@ -135,7 +155,7 @@ def twitter_login_done(request):
             return HttpResponseRedirect(reverse("socialauth_login_page"))
     
     twitter = oauthtwitter.TwitterOAuthClient(settings.TWITTER_CONSUMER_KEY, settings.TWITTER_CONSUMER_SECRET)  
-    access_token = twitter.fetch_access_token(token, verifier)
+    access_token = call_provider('twitter', twitter.fetch_access_token, token, verifier)
     
     request.session['access_token'] = access_token.to_string()
     
@@ -206,7 +226,7 @@ def openid_done(request, provider=None):
         else:
             #authenticate and login
             user = authenticate(openid_key=openid_key, request=request, provider = provider)
-            openid_profile = OpenidProfile.objects.get(openid_key=openid_key)
+            openid_profile = OpenidProfile.objects.get_for_key(openid_key, request)
 
             # From Apocalypse
             if user and request.session.get('consolidating_google', False):
@@ -234,7 +254,7 @@ def openid_done(request, provider=None):
                     return HttpResponseRedirect(settings.CONSOLIDATE_GOOGLE_FAILED)
 
             # From Federation
-            if user and OpenidProfile.objects.needs_google_crossdomain_merge(openid_key):
+            if user and OpenidProfile.objects.needs_google_crossdomain_merge(openid_key, request):
                 session = dict(request.session)
                 login(request, user)
                 restore_session(request, session)
@@ -282,6 +302,7 @@ def facebook_login(request):
 
     return HttpResponseRedirect(url)
     
+@provider_view
 def facebook_login_done(request):
     API_KEY = settings.FACEBOOK_API_KEY
     """